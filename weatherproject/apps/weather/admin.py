@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Location, WeatherData, UserSearchHistory
+from .models import Location, WeatherData, UserSearchHistory, LocationSearchCount, ProfileReport
 
 @admin.register(Location)
 class LocationAdmin(admin.ModelAdmin):
@@ -19,4 +19,17 @@ class UserSearchHistoryAdmin(admin.ModelAdmin):
     list_display = ('user', 'location', 'search_time', 'via_api')
     list_filter = ('via_api', 'search_time')
     search_fields = ('user__username', 'location__name')
-    date_hierarchy = 'search_time' 
\ No newline at end of file
+    date_hierarchy = 'search_time'
+
+@admin.register(LocationSearchCount)
+class LocationSearchCountAdmin(admin.ModelAdmin):
+    list_display = ('location', 'hour', 'count')
+    search_fields = ('location__name',)
+    date_hierarchy = 'hour'
+
+@admin.register(ProfileReport)
+class ProfileReportAdmin(admin.ModelAdmin):
+    list_display = ('name', 'kind', 'seconds', 'status_code', 'created_at')
+    list_filter = ('kind',)
+    search_fields = ('name',)
+    date_hierarchy = 'created_at'
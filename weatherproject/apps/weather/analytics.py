@@ -0,0 +1,48 @@
+from datetime import timedelta
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+from .models import LocationSearchCount, UserSearchHistory
+
+
+def hour_start(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def increment_search_count(location_id, hour, amount=1):
+    """Add to a location's counter for one hour, creating the row if needed"""
+    counters = LocationSearchCount.objects.filter(location_id=location_id, hour=hour)
+    if counters.update(count=F('count') + amount):
+        return
+    try:
+        with transaction.atomic():
+            LocationSearchCount.objects.create(location_id=location_id, hour=hour, count=amount)
+    except IntegrityError:
+        # Created concurrently by another request
+        counters.update(count=F('count') + amount)
+
+
+def record_search(user, location_id, via_api=True):
+    """Store a search and bump the location's rolling hourly counter"""
+    search = UserSearchHistory.objects.create(user=user, location_id=location_id, via_api=via_api)
+    increment_search_count(location_id, hour_start(search.search_time))
+    return search
+
+
+def search_counts(since, location_ids=None):
+    """{location_id: searches} since a moment, read from the hourly counters"""
+    counters = LocationSearchCount.objects.filter(hour__gte=hour_start(since))
+    if location_ids is not None:
+        counters = counters.filter(location_id__in=location_ids)
+    return dict(counters.values('location_id').annotate(searches=Sum('count')).values_list('location_id', 'searches'))
+
+
+def popular_locations(hours=1, limit=10):
+    """Most searched locations over the last `hours` hours (current hour included)"""
+    since = hour_start(timezone.now() - timedelta(hours=hours - 1))
+    return list(
+        LocationSearchCount.objects.filter(hour__gte=since)
+        .values('location_id', 'location__name', 'location__country', 'location__latitude', 'location__longitude')
+        .annotate(searches=Sum('count'))
+        .order_by('-searches')[:limit]
+    )
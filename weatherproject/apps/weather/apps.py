@@ -2,4 +2,12 @@ from django.apps import AppConfig
 
 class WeatherConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'apps.weather'
\ No newline at end of file
+    name = 'apps.weather'
+
+    def ready(self):
+        from django.db.models.signals import post_delete, post_save
+        from .models import Location
+        from .search_index import location_deleted, location_saved
+        from . import warmup  # noqa: F401 (registers the shared-cache check)
+        post_save.connect(location_saved, sender=Location, dispatch_uid='weather_location_index')
+        post_delete.connect(location_deleted, sender=Location, dispatch_uid='weather_location_index_delete')
@@ -0,0 +1,79 @@
+import hashlib
+import json
+import logging
+from django.core.cache import cache
+from django.utils import timezone
+from .exceptions import QuotaExceeded
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = 'weather'
+
+
+def make_key(*parts):
+    """Build a namespaced cache key from its parts"""
+    return ':'.join([KEY_PREFIX] + [str(part).replace(' ', '_') for part in parts])
+
+
+def get_or_compute(key, compute, timeout, stale_timeout=None):
+    """Return the cached value for key, computing and storing it on a miss.
+
+    None results are not cached so a failed upstream call is retried next time.
+    With stale_timeout, a second copy is kept that long and served instead of
+    failing when compute() runs out of upstream quota.
+    """
+    value = cache.get(key)
+    if value is None:
+        try:
+            value = compute()
+        except QuotaExceeded:
+            value = cache.get(stale_key(key)) if stale_timeout else None
+            if value is None:
+                raise
+            logger.warning(f"Upstream quota exhausted, serving stale {key}")
+            return value
+        if value is not None:
+            store(key, value, timeout, stale_timeout)
+    return value
+
+
+def store(key, value, timeout, stale_timeout=None):
+    """Cache a value (and its stale fallback copy) as get_or_compute would"""
+    cache.set(key, value, timeout)
+    if stale_timeout:
+        cache.set(stale_key(key), value, stale_timeout)
+
+
+def stale_key(key):
+    return f"{key}:stale"
+
+
+def content_version(payload, exclude=()):
+    """Stable hash of a JSON payload, ignoring volatile keys at any depth"""
+    encoded = json.dumps(_without_keys(payload, exclude), sort_keys=True, default=str).encode()
+    return hashlib.sha1(encoded).hexdigest()
+
+
+def _without_keys(payload, exclude):
+    if isinstance(payload, dict):
+        return {key: _without_keys(value, exclude) for key, value in payload.items() if key not in exclude}
+    if isinstance(payload, list):
+        return [_without_keys(value, exclude) for value in payload]
+    return payload
+
+
+def get_version(key):
+    """Return the stored {'etag', 'last_modified', 'usage'} for a response, if still fresh"""
+    return cache.get(key)
+
+
+def set_version(key, etag, timeout, usage=None):
+    """Record the current version of a response, keeping its original
+    Last-Modified time while the content is unchanged. `usage` is what the
+    response counted ({location_id: search}), replayed for 304s."""
+    version = cache.get(key)
+    if version is None or version['etag'] != etag:
+        version = {'etag': etag, 'last_modified': timezone.now().timestamp()}
+    version['usage'] = usage or {}
+    cache.set(key, version, timeout)
+    return version
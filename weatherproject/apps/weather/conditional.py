@@ -0,0 +1,67 @@
+from functools import wraps
+from urllib.parse import urlencode
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+from .caching import make_key, content_version, get_version, set_version
+from .scheduling import record_usage
+
+# Timestamps that change on every request without the data changing
+VOLATILE_FIELDS = ('generated_at', 'last_updated')
+
+
+def conditional_get(max_age):
+    """Add ETag / Last-Modified / Cache-Control to a weather GET handler and
+    answer If-None-Match / If-Modified-Since with 304 without running it.
+
+    max_age is the freshness of the endpoint's data in seconds, or a callable
+    returning it. The version of each response (per view, city and query string)
+    is kept in the cache for that long, so a revalidation is a single cache read
+    plus the usage counting (scheduling.record_usage) the full response did.
+    Direct calls from other views (CombinedForecastAPI) bypass all of this.
+    """
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            if getattr(self, 'request', None) is None:
+                # Not dispatched through the URLconf, e.g. CombinedForecastAPI
+                return view_method(self, request, *args, **kwargs)
+
+            version_key = make_key(
+                'version',
+                type(self).__name__,
+                *[str(value).strip().lower() for value in list(args) + list(kwargs.values())],
+                urlencode(sorted(request.query_params.items()))
+            )
+            seconds = max_age() if callable(max_age) else max_age
+
+            version = get_version(version_key)
+            if version is not None:
+                not_modified = get_conditional_response(
+                    request,
+                    etag=quote_etag(version['etag']),
+                    last_modified=int(version['last_modified'])
+                )
+                if not_modified is not None:
+                    for location_id, search in version.get('usage', {}).items():
+                        record_usage(request, location_id, search)
+                    _add_cache_headers(request, not_modified, version, seconds)
+                    return not_modified
+
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                etag = content_version(response.data, exclude=VOLATILE_FIELDS)
+                version = set_version(version_key, etag, seconds, getattr(request, 'weather_usage', None))
+                _add_cache_headers(request, response, version, seconds)
+            return response
+        return wrapper
+    return decorator
+
+
+def _add_cache_headers(request, response, version, max_age):
+    response['ETag'] = quote_etag(version['etag'])
+    response['Last-Modified'] = http_date(version['last_modified'])
+    if request.user.is_authenticated:
+        patch_cache_control(response, private=True, max_age=max_age)
+    else:
+        patch_cache_control(response, public=True, max_age=max_age)
@@ -0,0 +1,16 @@
+class QuotaExceeded(Exception):
+    """Raised when an upstream call would go over the shared API budget"""
+
+    def __init__(self, bucket, priority, retry_after):
+        self.bucket = bucket
+        self.priority = priority
+        self.retry_after = retry_after
+        super().__init__(f"Upstream quota for {bucket} exhausted for {priority} requests; retry in {retry_after}s")
+
+
+class ReplayMiss(Exception):
+    """Raised in replay mode when no response was recorded for a request"""
+
+    def __init__(self, key):
+        self.key = key
+        super().__init__(f"No recorded upstream response for {key}")
@@ -0,0 +1,69 @@
+import csv
+import json
+from django.db.models import Q
+from .models import WeatherData
+
+EXPORT_FIELDS = ['id', 'location_id', 'timestamp', 'temperature', 'humidity',
+                 'wind_speed', 'weather_type', 'is_forecast']
+EXPORT_COLUMNS = EXPORT_FIELDS[:2] + ['location'] + EXPORT_FIELDS[2:]
+
+
+def iter_weather_rows(locations, start=None, end=None, is_forecast=None, chunk_size=2000):
+    """Yield WeatherData rows as dicts, one location at a time, in (timestamp, id) order.
+
+    Each chunk is a separate keyset query that resumes after the last row of the
+    previous one, so it stays on the (location, timestamp) index and memory use
+    doesn't depend on the size of the range.
+    """
+    for location in locations:
+        queryset = WeatherData.objects.filter(location=location)
+        if start is not None:
+            queryset = queryset.filter(timestamp__gte=start)
+        if end is not None:
+            queryset = queryset.filter(timestamp__lt=end)
+        if is_forecast is not None:
+            queryset = queryset.filter(is_forecast=is_forecast)
+        queryset = queryset.order_by('timestamp', 'id').values_list(*EXPORT_FIELDS)
+
+        last = None
+        while True:
+            chunk = queryset
+            if last is not None:
+                chunk = chunk.filter(Q(timestamp__gt=last[0]) | Q(timestamp=last[0], id__gt=last[1]))
+            rows = 0
+            for values in chunk[:chunk_size].iterator(chunk_size=chunk_size):
+                row = dict(zip(EXPORT_FIELDS, values))
+                row['location'] = location.name
+                last = (row['timestamp'], row['id'])
+                rows += 1
+                yield row
+            if rows < chunk_size:
+                break
+
+
+class _Echo:
+    """File-like object whose write() just returns the value (for csv.writer)"""
+    def write(self, value):
+        return value
+
+
+def stream_csv(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        yield writer.writerow([
+            row['timestamp'].isoformat() if column == 'timestamp' else row[column]
+            for column in EXPORT_COLUMNS
+        ])
+
+
+def stream_ndjson(rows):
+    for row in rows:
+        row['timestamp'] = row['timestamp'].isoformat()
+        yield json.dumps({column: row[column] for column in EXPORT_COLUMNS}) + '\n'
+
+
+EXPORT_FORMATS = {
+    'csv': (stream_csv, 'text/csv'),
+    'ndjson': (stream_ndjson, 'application/x-ndjson'),
+}
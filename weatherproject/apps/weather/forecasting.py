@@ -0,0 +1,271 @@
+import time
+import warnings
+from django.conf import settings
+from .profiling import record_fit
+
+# numpy, pandas and statsmodels are imported inside the engines so that web and
+# Celery processes that never forecast don't pay their import time and memory.
+HEAVY_MODULES = ['numpy', 'pandas', 'scipy', 'statsmodels']
+
+# Daily variables pulled from the Open-Meteo archive, in response order
+FORECAST_VARIABLES = ['temperature_max', 'temperature_min', 'precipitation', 'wind_speed', 'humidity']
+FORECAST_STEPS = 7
+MIN_HISTORY_POINTS = 30
+# Shorthands accepted by ?variables=
+VARIABLE_GROUPS = {
+    'temperature': ['temperature_max', 'temperature_min'],
+}
+
+
+def select_variables(value=None):
+    """Parse a comma-separated ?variables= list into FORECAST_VARIABLES order"""
+    if not value:
+        return list(FORECAST_VARIABLES)
+    requested = set()
+    for name in value.split(','):
+        name = name.strip()
+        if name in VARIABLE_GROUPS:
+            requested.update(VARIABLE_GROUPS[name])
+        elif name in FORECAST_VARIABLES:
+            requested.add(name)
+        elif name:
+            choices = ', '.join(list(VARIABLE_GROUPS) + FORECAST_VARIABLES)
+            raise ValueError(f"Unknown forecast variable '{name}'. Choose from: {choices}")
+    if not requested:
+        raise ValueError("variables cannot be empty")
+    return [column for column in FORECAST_VARIABLES if column in requested]
+
+
+def select_steps(value=None, maximum=FORECAST_STEPS):
+    """Parse ?horizon= (days ahead, 1 to `maximum`)"""
+    if value in (None, ''):
+        return maximum
+    try:
+        steps = int(value)
+    except ValueError:
+        raise ValueError("horizon must be a whole number of days")
+    if not 1 <= steps <= maximum:
+        raise ValueError(f"horizon must be between 1 and {maximum} days")
+    return steps
+
+
+class ForecastEngine:
+    """Base class for forecasting engines used by ARIMAForecastAPI.
+
+    An engine turns a history DataFrame (one column per variable) into
+    (forecast_results, model_errors, model_status), each keyed by variable.
+    Only the requested `variables` (default: all of FORECAST_VARIABLES) are
+    modelled.
+    """
+    name = None
+    label = None
+
+    def forecast(self, historical_data, steps=FORECAST_STEPS, variables=None):
+        raise NotImplementedError
+
+    def forecast_many(self, histories, steps=FORECAST_STEPS, variables=None):
+        """Forecast a list of histories; engines can override this to batch"""
+        return [self.forecast(historical_data, steps, variables) for historical_data in histories]
+
+
+class ARIMAEngine(ForecastEngine):
+    """One statsmodels ARIMA fit per variable (accurate, slow)"""
+    name = 'arima'
+    label = 'ARIMA'
+
+    # ARIMA parameters for the different weather variables
+    orders = {
+        'temperature_max': (3, 1, 2),
+        'temperature_min': (3, 1, 2),
+        'precipitation': (1, 1, 1),
+        'wind_speed': (2, 1, 1),
+        'humidity': (2, 1, 1)
+    }
+
+    def forecast(self, historical_data, steps=FORECAST_STEPS, variables=None):
+        from statsmodels.tsa.arima.model import ARIMA
+
+        forecast_results = {}
+        model_errors = {}
+        model_status = {}
+
+        for column in variables or FORECAST_VARIABLES:
+            series = historical_data[column].ffill().bfill()
+            started = time.perf_counter()
+            try:
+                if len(series) < MIN_HISTORY_POINTS:
+                    raise ValueError(f"Not enough data points: {len(series)}")
+
+                # Train ARIMA model. statsmodels installs "always" filters for its
+                # convergence warnings when first imported, so silence them here
+                with warnings.catch_warnings():
+                    warnings.simplefilter('ignore')
+                    model_fit = ARIMA(series, order=self.orders[column]).fit()
+
+                # Generate forecast
+                forecast_results[column] = model_fit.forecast(steps=steps).tolist()
+                model_errors[column] = "success"
+                model_status[column] = "trained"
+
+                # Optimizer diagnostics (only kept while profiling, see profiling.record_fit)
+                retvals = getattr(model_fit, 'mle_retvals', None) or {}
+                record_fit(
+                    self.name, column, time.perf_counter() - started, "trained",
+                    iterations=retvals.get('iterations'), converged=retvals.get('converged'),
+                    order=self.orders[column], points=len(series)
+                )
+
+            except Exception as e:
+                error_msg = f"ARIMA failed for {column}: {str(e)}"
+                print(error_msg)
+                model_errors[column] = error_msg
+                model_status[column] = "failed"
+                # Use simple average as fallback
+                avg_value = series.mean() if len(series) > 0 else 0
+                forecast_results[column] = [avg_value] * steps
+                record_fit(
+                    self.name, column, time.perf_counter() - started, "failed",
+                    order=self.orders[column], points=len(series), error=str(e)
+                )
+
+        return forecast_results, model_errors, model_status
+
+
+class VectorizedEngine(ForecastEngine):
+    """Seasonal-naive baseline plus a linear AR model on its residuals.
+
+    Every variable of every location is a row of one matrix; the AR
+    coefficients for all rows are found with a single batched least-squares
+    solve, so thousands of series cost about as much as a handful of ARIMA fits.
+    """
+    name = 'vectorized'
+    label = 'VectorAR'
+
+    def __init__(self, lags=3, season=1, ridge=1e-3):
+        self.lags = lags
+        self.season = season
+        self.ridge = ridge
+
+    def forecast(self, historical_data, steps=FORECAST_STEPS, variables=None):
+        return self.forecast_many([historical_data], steps, variables)[0]
+
+    def forecast_many(self, histories, steps=FORECAST_STEPS, variables=None):
+        """Forecast many histories, one batched solve per history length.
+
+        Histories of the same length share one matrix, so a location with a
+        short or gappy history only fails its own forecast.
+        """
+        if not histories:
+            return []
+        variables = variables or FORECAST_VARIABLES
+
+        by_length = {}
+        for index, historical_data in enumerate(histories):
+            by_length.setdefault(len(historical_data), []).append(index)
+
+        results = [None] * len(histories)
+        for length, indexes in by_length.items():
+            batch = self._forecast_batch([histories[index] for index in indexes], length, steps, variables)
+            for index, result in zip(indexes, batch):
+                results[index] = result
+        return results
+
+    def _forecast_batch(self, histories, length, steps, variables):
+        """Forecast histories that all have `length` points"""
+        import numpy as np
+
+        matrix = np.vstack([
+            historical_data[variables].ffill().bfill().to_numpy(dtype=float).T
+            for historical_data in histories
+        ])
+
+        started = time.perf_counter()
+        if length < max(MIN_HISTORY_POINTS, self.season + self.lags + 2):
+            predictions = np.full((len(matrix), steps), np.nan)
+            error = f"Not enough data points: {length}"
+        else:
+            predictions = self.predict_matrix(matrix, steps)
+            error = None
+        # One batched solve covers every series, so it is recorded as one fit
+        record_fit(
+            self.name, '*', time.perf_counter() - started, "failed" if error else "trained",
+            series=len(matrix), points=length, error=error
+        )
+
+        results = []
+        for index in range(len(histories)):
+            forecast_results = {}
+            model_errors = {}
+            model_status = {}
+            for offset, column in enumerate(variables):
+                row = index * len(variables) + offset
+                prediction = predictions[row]
+                if error is None and np.all(np.isfinite(prediction)):
+                    forecast_results[column] = prediction.tolist()
+                    model_errors[column] = "success"
+                    model_status[column] = "trained"
+                else:
+                    model_errors[column] = f"VectorAR failed for {column}: {error or 'non-finite forecast'}"
+                    model_status[column] = "failed"
+                    # Use simple average as fallback, like the ARIMA engine
+                    history = matrix[row][np.isfinite(matrix[row])]
+                    avg_value = float(np.mean(history)) if len(history) else 0
+                    forecast_results[column] = [avg_value] * steps
+            results.append((forecast_results, model_errors, model_status))
+        return results
+
+    def predict_matrix(self, values, steps):
+        """Forecast `steps` points for every row of an (n_series, n_points) array"""
+        import numpy as np
+
+        season, lags = self.season, self.lags
+        n_series, n_points = values.shape
+
+        # Seasonal-naive residuals: z[t] = y[t + season] - y[t]
+        residuals = values[:, season:] - values[:, :-season]
+        n_samples = residuals.shape[1] - lags
+
+        # Design tensor (n_series, n_samples, 1 + lags): intercept, lag 1 ... lag p
+        design = np.empty((n_series, n_samples, lags + 1))
+        design[:, :, 0] = 1.0
+        for lag in range(1, lags + 1):
+            design[:, :, lag] = residuals[:, lags - lag:lags - lag + n_samples]
+        target = residuals[:, lags:]
+
+        # Batched ridge-regularised normal equations
+        gram = np.einsum('nsi,nsj->nij', design, design) + self.ridge * np.eye(lags + 1)
+        moment = np.einsum('nsi,ns->ni', design, target)
+        coefficients = np.linalg.solve(gram, moment[..., None])[..., 0]
+
+        extended_values = np.concatenate([values, np.empty((n_series, steps))], axis=1)
+        extended_residuals = np.concatenate([residuals, np.empty((n_series, steps))], axis=1)
+        for step in range(steps):
+            position = n_points - season + step
+            recent = extended_residuals[:, position - lags:position][:, ::-1]
+            residual = coefficients[:, 0] + np.einsum('ni,ni->n', coefficients[:, 1:], recent)
+            extended_residuals[:, position] = residual
+            extended_values[:, n_points + step] = extended_values[:, n_points + step - season] + residual
+
+        return extended_values[:, n_points:]
+
+
+def preload():
+    """Import the scientific stack up front (for dedicated forecasting workers)"""
+    import numpy
+    import pandas
+    from statsmodels.tsa.arima.model import ARIMA
+
+
+ENGINES = {
+    ARIMAEngine.name: ARIMAEngine,
+    VectorizedEngine.name: VectorizedEngine,
+}
+
+
+def get_engine(name=None):
+    """Instantiate an engine by name, defaulting to WEATHER_FORECAST_ENGINE"""
+    name = name or getattr(settings, 'WEATHER_FORECAST_ENGINE', ARIMAEngine.name)
+    try:
+        return ENGINES[name]()
+    except KeyError:
+        raise ValueError(f"Unknown forecast engine '{name}'. Choose from: {', '.join(sorted(ENGINES))}")
@@ -0,0 +1,41 @@
+import math
+from collections import defaultdict
+from django.conf import settings
+
+
+def get_grid_size():
+    """Grid cell size in degrees (0 disables grid snapping)"""
+    return float(getattr(settings, 'WEATHER_GRID_SIZE', 0) or 0)
+
+
+def snap_to_grid(lat, lon, size=None):
+    """Return (cell_key, lat, lon) for the grid cell containing a point.
+
+    Upstream requests are made for the returned coordinates so every location
+    inside one cell shares the same data. With grid mode off each point is its
+    own cell and keeps its exact coordinates.
+    """
+    lat, lon = float(lat), float(lon)
+    size = get_grid_size() if size is None else size
+
+    if size <= 0:
+        return f"{lat:.4f},{lon:.4f}", lat, lon
+
+    # Round away float error first: 0.3 / 0.1 is 2.9999999999999996, which
+    # would put a point on a cell edge into the cell below
+    row = math.floor(round(lat / size, 9))
+    col = math.floor(round(lon / size, 9))
+    center_lat = round((row + 0.5) * size, 4)
+    center_lon = round((col + 0.5) * size, 4)
+    return f"{size:g}:{row}:{col}", center_lat, center_lon
+
+
+def group_by_cell(locations, size=None):
+    """Bucket locations by grid cell -> {cell_key: ((lat, lon), [locations])}"""
+    cells = {}
+    members = defaultdict(list)
+    for location in locations:
+        key, lat, lon = snap_to_grid(location.latitude, location.longitude, size)
+        cells.setdefault(key, (lat, lon))
+        members[key].append(location)
+    return {key: (cells[key], members[key]) for key in cells}
@@ -0,0 +1,76 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Sum
+from .analytics import increment_search_count
+from .models import Location, LocationSearchCount, WeatherData, UserSearchHistory
+from .search_index import normalize
+
+# Two decimals is ~1 km: spellings of one place geocode well within that
+KEY_PRECISION = 2
+
+
+def canonical_key(name, latitude, longitude):
+    """Identity of a place: rounded coordinates plus its normalized name"""
+    return f"{float(latitude):.{KEY_PRECISION}f},{float(longitude):.{KEY_PRECISION}f}:{normalize(name)}"
+
+
+def coordinate_key(latitude, longitude):
+    """Coarser grouping used to find existing duplicates spelled differently"""
+    return f"{float(latitude):.{KEY_PRECISION}f},{float(longitude):.{KEY_PRECISION}f}"
+
+
+def get_or_create_location(name, latitude, longitude, country):
+    """Find a location by canonical key, creating it if needed.
+
+    `name` should be the geocoder's name for the place, so "nyc", "NYC" and
+    "New York" all resolve to the same row.
+    """
+    key = canonical_key(name, latitude, longitude)
+    location = Location.objects.filter(canonical_key=key).first()
+    if location is not None:
+        return location
+
+    # Rows created before canonical keys: adopt a same-named one instead of duplicating it
+    legacy = Location.objects.filter(name__iexact=name, canonical_key__isnull=True).order_by('id').first()
+    if legacy is not None:
+        legacy.canonical_key = key
+        legacy.latitude = latitude
+        legacy.longitude = longitude
+        legacy.save(update_fields=['canonical_key', 'latitude', 'longitude'])
+        return legacy
+
+    try:
+        with transaction.atomic():
+            return Location.objects.create(
+                name=name,
+                latitude=latitude,
+                longitude=longitude,
+                country=country,
+                canonical_key=key
+            )
+    except IntegrityError:
+        # Another request created it first
+        return Location.objects.get(canonical_key=key)
+
+
+def merge_locations(survivor, duplicates):
+    """Move the history of duplicate locations onto survivor and delete them.
+
+    A survivor that already has a canonical key keeps it; otherwise it is keyed
+    from its own name.
+    """
+    duplicate_ids = [location.id for location in duplicates]
+    with transaction.atomic():
+        moved = WeatherData.objects.filter(location_id__in=duplicate_ids).update(location=survivor)
+        moved += UserSearchHistory.objects.filter(location_id__in=duplicate_ids).update(location=survivor)
+        # Hourly counters are unique per (location, hour), so add them up instead of re-pointing
+        hourly = (
+            LocationSearchCount.objects.filter(location_id__in=duplicate_ids)
+            .values('hour').annotate(searches=Sum('count'))
+        )
+        for row in hourly:
+            increment_search_count(survivor.id, row['hour'], row['searches'])
+        Location.objects.filter(id__in=duplicate_ids).delete()
+        if survivor.canonical_key is None:
+            survivor.canonical_key = canonical_key(survivor.name, survivor.latitude, survivor.longitude)
+            survivor.save(update_fields=['canonical_key'])
+    return moved
@@ -0,0 +1,82 @@
+# apps/weather/management/commands/dedupe_locations.py
+from collections import defaultdict
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from apps.weather.models import Location
+from apps.weather.caching import get_or_compute, make_key
+from apps.weather.locations import canonical_key, coordinate_key, merge_locations
+from apps.weather import quota
+
+
+class Command(BaseCommand):
+    help = 'Merges duplicate locations and assigns canonical keys'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be merged')
+        parser.add_argument('--by-coordinates', action='store_true',
+                            help='Also merge differently named rows at the same rounded coordinates '
+                                 '(default: only rows whose names match too); check with --dry-run first')
+
+    def handle(self, *args, **options):
+        # Locations were created from geocoder coordinates, so spellings of one
+        # place ("new york", "NYC") land on the same rounded point. Different
+        # places can share a 0.01 degree bin too, hence the opt-in.
+        groups = defaultdict(list)
+        for location in Location.objects.order_by('id'):
+            if options['by_coordinates']:
+                key = coordinate_key(location.latitude, location.longitude)
+            else:
+                key = canonical_key(location.name, location.latitude, location.longitude)
+            groups[key].append(location)
+
+        merged = rows_moved = renamed = 0
+        for locations in groups.values():
+            if len(locations) < 2:
+                # Unkeyed singletons are left for get_or_create_location to adopt
+                # under the geocoder's name
+                continue
+
+            # Keep a row that already has a canonical key: it carries the geocoder's
+            # name, while older rows carry whatever the user typed ("Nyc")
+            locations.sort(key=lambda location: (location.canonical_key is None, location.id))
+            survivor, duplicates = locations[0], locations[1:]
+            new_name = None
+            if survivor.canonical_key is None and options['by_coordinates']:
+                new_name = self._geocoder_name(survivor)
+
+            names = ', '.join(location.name for location in duplicates)
+            label = f"{survivor.name} -> {new_name}" if new_name and new_name != survivor.name else survivor.name
+            self.stdout.write(f"{label} (#{survivor.id}) <- {names}")
+            merged += len(duplicates)
+            if options['dry_run']:
+                continue
+
+            if new_name and new_name != survivor.name:
+                survivor.name = new_name
+                survivor.save(update_fields=['name'])
+                renamed += 1
+            rows_moved += merge_locations(survivor, duplicates)
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"Would merge {merged} duplicate locations"))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"Merged {merged} duplicate locations, moved {rows_moved} history rows, renamed {renamed} locations"
+            ))
+
+    def _geocoder_name(self, location):
+        """The name the geocoder gives a location, so its canonical key matches the
+        one get_or_create_location will look up (falls back to the stored name)"""
+        from apps.weather.views import CurrentWeatherAPI
+
+        city_name = location.name.strip().lower()
+        try:
+            geo_data = get_or_compute(
+                make_key('geocode', city_name),
+                lambda: CurrentWeatherAPI()._geocode(city_name, quota.BACKGROUND),
+                settings.WEATHER_GEOCODE_CACHE_TIMEOUT
+            )
+            return geo_data[0].get('name') or location.name
+        except Exception as e:
+            self.stdout.write(self.style.WARNING(f"Could not geocode {location.name}, keeping its name: {str(e)}"))
+            return location.name
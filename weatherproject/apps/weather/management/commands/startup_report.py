@@ -0,0 +1,84 @@
+# apps/weather/management/commands/startup_report.py
+import json
+import os
+import subprocess
+import sys
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from apps.weather.forecasting import HEAVY_MODULES
+
+# Modules each process type imports on boot
+PROFILES = {
+    'web': ['config.urls'],
+    'celery': ['config.celery', 'apps.weather.tasks'],
+    'forecasting': ['config.celery', 'apps.weather.tasks', 'apps.weather.forecasting'],
+}
+
+# Runs in a fresh interpreter so the numbers reflect a cold start
+PROBE = """
+import json, os, resource, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {base_dir!r})
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', {settings_module!r})
+import django
+django.setup()
+setup_time = time.perf_counter() - start
+for module in {modules!r}:
+    __import__(module)
+if {preload!r}:
+    from apps.weather.forecasting import preload
+    preload()
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{
+    'setup_seconds': setup_time,
+    'total_seconds': time.perf_counter() - start,
+    'max_rss_mb': rss / (1024 * 1024 if sys.platform == 'darwin' else 1024),
+    'heavy_modules': sorted(m for m in {heavy!r} if m in sys.modules),
+}}))
+"""
+
+
+class Command(BaseCommand):
+    help = 'Reports cold-start import time and memory for web, Celery and forecasting processes'
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('profiles', nargs='*', help=f"Process types to measure: {', '.join(PROFILES)} (default: all)")
+        parser.add_argument('--runs', type=int, default=3, help='Cold starts per profile; the fastest is reported')
+        parser.add_argument('--fail-on-heavy', action='store_true',
+                            help='Exit with an error if web or celery processes load the scientific stack')
+
+    def handle(self, *args, **options):
+        profiles = options['profiles'] or list(PROFILES)
+        unknown = set(profiles) - set(PROFILES)
+        if unknown:
+            raise CommandError(f"Unknown profile(s): {', '.join(sorted(unknown))}")
+        offenders = []
+
+        self.stdout.write(f"{'profile':<12} {'setup (s)':>10} {'total (s)':>10} {'max RSS (MB)':>13}  heavy modules")
+        for profile in profiles:
+            results = [self._probe(profile) for _ in range(max(1, options['runs']))]
+            best = min(results, key=lambda result: result['total_seconds'])
+            heavy = ', '.join(best['heavy_modules']) or '-'
+            self.stdout.write(
+                f"{profile:<12} {best['setup_seconds']:>10.3f} {best['total_seconds']:>10.3f} "
+                f"{best['max_rss_mb']:>13.1f}  {heavy}"
+            )
+            if profile != 'forecasting' and best['heavy_modules']:
+                offenders.append(profile)
+
+        if offenders and options['fail_on_heavy']:
+            raise CommandError(f"Scientific stack loaded at startup by: {', '.join(offenders)}")
+
+    def _probe(self, profile):
+        code = PROBE.format(
+            base_dir=str(settings.BASE_DIR),
+            settings_module=os.environ.get('DJANGO_SETTINGS_MODULE', 'config.settings'),
+            modules=PROFILES[profile],
+            preload=profile == 'forecasting',
+            heavy=HEAVY_MODULES,
+        )
+        completed = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+        if completed.returncode != 0:
+            raise CommandError(f"Startup probe for '{profile}' failed:\n{completed.stderr}")
+        return json.loads(completed.stdout.strip().splitlines()[-1])
@@ -0,0 +1,36 @@
+# apps/weather/management/commands/warm_caches.py
+from django.core.management.base import BaseCommand, CommandError
+from apps.weather import warmup
+
+
+class Command(BaseCommand):
+    help = 'Warms the geocode, weather, forecast and ARIMA caches for the most searched locations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, help='Number of locations (default: WEATHER_WARMUP_LOCATIONS)')
+        parser.add_argument('--concurrency', type=int,
+                            help='Locations warmed in parallel (default: WEATHER_WARMUP_CONCURRENCY)')
+        parser.add_argument('--arima', choices=warmup.ARIMA_MODES, default=warmup.ARIMA_INLINE,
+                            help='Fit ARIMA forecasts here, queue them on the forecasting workers, or skip them')
+        parser.add_argument('--engine', help='Forecasting engine (default: WEATHER_FORECAST_ENGINE)')
+
+    def handle(self, *args, **options):
+        try:
+            summary = warmup.warm_caches(
+                limit=options['limit'],
+                concurrency=options['concurrency'],
+                arima=options['arima'],
+                engine_name=options['engine']
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        for name in summary['failed']:
+            self.stdout.write(self.style.WARNING(f"Failed: {name}"))
+        if summary['quota_exhausted']:
+            self.stdout.write(self.style.WARNING(
+                f"Background quota exhausted, skipped {len(summary['skipped'])} locations"
+            ))
+        self.stdout.write(self.style.SUCCESS(
+            f"Warmed {summary['warmed']}/{summary['locations']} locations in {summary['seconds']}s; cache marked ready"
+        ))
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0003_usersearchhistory_search_type_userloginhistory'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='canonical_key',
+            field=models.CharField(blank=True, max_length=160, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.5 on 2026-10-19 11:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncHour
+
+
+def backfill_search_counts(apps, schema_editor):
+    UserSearchHistory = apps.get_model('weather', 'UserSearchHistory')
+    LocationSearchCount = apps.get_model('weather', 'LocationSearchCount')
+    hourly = (
+        UserSearchHistory.objects.annotate(hour=TruncHour('search_time'))
+        .values('location_id', 'hour').annotate(searches=Count('id'))
+    )
+    LocationSearchCount.objects.bulk_create(
+        (LocationSearchCount(location_id=row['location_id'], hour=row['hour'], count=row['searches']) for row in hourly.iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0004_location_canonical_key'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='usersearchhistory',
+            index=models.Index(fields=['user', '-search_time'], name='weather_search_user_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usersearchhistory',
+            index=models.Index(fields=['location', 'search_time'], name='weather_search_loc_time_idx'),
+        ),
+        migrations.CreateModel(
+            name='LocationSearchCount',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField()),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_counts', to='weather.location')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['hour'], name='weather_search_count_hour_idx')],
+                'constraints': [models.UniqueConstraint(fields=('location', 'hour'), name='weather_search_count_unique_hour')],
+            },
+        ),
+        migrations.RunPython(backfill_search_counts, migrations.RunPython.noop),
+    ]
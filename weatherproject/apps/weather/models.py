@@ -6,6 +6,8 @@ class Location(models.Model):
     latitude = models.FloatField()
     longitude = models.FloatField()
     country = models.CharField(max_length=100, blank=True)
+    # Rounded coordinates + normalized name (see apps.weather.locations.canonical_key)
+    canonical_key = models.CharField(max_length=160, unique=True, null=True, blank=True)
     
     def __str__(self):
         return self.name
@@ -20,6 +22,7 @@ class WeatherData(models.Model):
         (0, 'Clear'), (1, 'Clouds'), (2, 'Rain'),
         (3, 'Snow'), (4, 'Thunderstorm')
     ])
+    is_forecast = models.BooleanField(default=False)
     
     def __str__(self):
         return f"{self.location.name} - {self.timestamp}"
@@ -30,5 +33,47 @@ class UserSearchHistory(models.Model):
     search_time = models.DateTimeField(auto_now_add=True)
     via_api = models.BooleanField(default=False)
     
+    class Meta:
+        indexes = [
+            # Per-user history (UserSearchHistoryAPI) and per-location activity (scheduling)
+            models.Index(fields=['user', '-search_time'], name='weather_search_user_time_idx'),
+            models.Index(fields=['location', 'search_time'], name='weather_search_loc_time_idx'),
+        ]
+    
     def __str__(self):
         return f"{self.user} searched {self.location.name}"
+
+class LocationSearchCount(models.Model):
+    """Searches per location per hour, maintained on write by analytics.record_search"""
+    location = models.ForeignKey(Location, on_delete=models.CASCADE, related_name='search_counts')
+    hour = models.DateTimeField()
+    count = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['location', 'hour'], name='weather_search_count_unique_hour'),
+        ]
+        indexes = [
+            models.Index(fields=['hour'], name='weather_search_count_hour_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.location.name} @ {self.hour}: {self.count}"
+
+class ProfileReport(models.Model):
+    """A stored profile of one request or forecast job (see apps.weather.profiling)"""
+    KIND_CHOICES = [('request', 'Request'), ('task', 'Task')]
+    
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    name = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+    seconds = models.FloatField()
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+    fits = models.JSONField(default=list, blank=True)  # Per-fit iterations, convergence, wall time
+    stats = models.TextField(blank=True)  # cProfile output, top functions by cumulative time
+    
+    class Meta:
+        ordering = ['-created_at']
+    
+    def __str__(self):
+        return f"{self.name} ({self.seconds:.2f}s)"
@@ -0,0 +1,108 @@
+import contextvars
+import cProfile
+import io
+import pstats
+import time
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+PROFILE_HEADER = 'HTTP_X_WEATHER_PROFILE'
+PROFILE_PARAM = 'profile'
+
+# Per-fit statistics of the request or task being profiled (None: not collecting)
+_fits = contextvars.ContextVar('weather_profile_fits', default=None)
+
+
+def record_fit(engine, variable, seconds, status, iterations=None, converged=None, **extra):
+    """Note one model fit if a profile is being collected; a no-op otherwise"""
+    fits = _fits.get()
+    if fits is not None:
+        fits.append({
+            'engine': engine,
+            'variable': variable,
+            'seconds': round(seconds, 4),
+            'status': status,
+            'iterations': iterations,
+            'converged': converged,
+            **extra
+        })
+
+
+def collecting_fits():
+    return _fits.get() is not None
+
+
+@contextmanager
+def collect_fits():
+    """Collect record_fit() calls made inside the block into the yielded list"""
+    fits = []
+    token = _fits.set(fits)
+    try:
+        yield fits
+    finally:
+        _fits.reset(token)
+
+
+def format_stats(profiler, limit=None):
+    """Top functions by cumulative time, as pstats prints them"""
+    output = io.StringIO()
+    stats = pstats.Stats(profiler, stream=output)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(limit or settings.WEATHER_PROFILE_TOP_FUNCTIONS)
+    return output.getvalue()
+
+
+def save_report(kind, name, seconds, fits, stats='', status_code=None):
+    from .models import ProfileReport
+
+    return ProfileReport.objects.create(
+        kind=kind,
+        name=name[:255],
+        seconds=seconds,
+        status_code=status_code,
+        fits=fits,
+        stats=stats
+    )
+
+
+class ProfilingMiddleware:
+    """cProfile a single request on demand.
+
+    Staff users add `X-Weather-Profile: 1` or `?profile=1` to a request; its
+    cProfile stats and any model fits it ran are stored as a ProfileReport and
+    the response carries an X-Profile-Id header. With WEATHER_PROFILING_ENABLED
+    off Django drops the middleware entirely.
+    """
+
+    def __init__(self, get_response):
+        if not settings.WEATHER_PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not self._requested(request):
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        with collect_fits() as fits:
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        seconds = time.perf_counter() - started
+
+        report = save_report(
+            'request', f"{request.method} {request.get_full_path()}", seconds, fits,
+            format_stats(profiler), response.status_code
+        )
+        response['X-Profile-Id'] = str(report.pk)
+        return response
+
+    def _requested(self, request):
+        flag = request.META.get(PROFILE_HEADER) or request.GET.get(PROFILE_PARAM)
+        if flag not in ('1', 'true'):
+            return False
+        user = getattr(request, 'user', None)
+        return bool(user and user.is_staff)
@@ -0,0 +1,62 @@
+import time
+from django.conf import settings
+from django.core.cache import cache
+from .caching import make_key
+from .exceptions import QuotaExceeded
+
+# Priority classes: interactive (user requests) may use the whole budget of a
+# window, background work (Celery refreshes, pre-warming) only its share of it
+INTERACTIVE = 'interactive'
+BACKGROUND = 'background'
+
+
+def _bucket_config(bucket):
+    config = settings.UPSTREAM_QUOTAS[bucket]
+    return config['calls'], config['period']
+
+
+def _window(bucket):
+    """Key of the current window and seconds until it refills"""
+    calls, period = _bucket_config(bucket)
+    now = time.time()
+    window = int(now // period)
+    return make_key('quota', bucket, window), max(1, int((window + 1) * period - now))
+
+
+def acquire(bucket, priority=INTERACTIVE, cost=1):
+    """Take `cost` tokens from a bucket shared by every web and Celery process.
+
+    Each bucket holds `calls` tokens per `period` seconds. The counter lives in
+    the cache and is bumped with an atomic incr, so with a shared cache backend
+    (REDIS_CACHE_URL) all processes draw on the same budget.
+    """
+    calls, period = _bucket_config(bucket)
+    limit = int(calls * settings.UPSTREAM_PRIORITY_SHARES[priority])
+    key, retry_after = _window(bucket)
+
+    cache.add(key, 0, period * 2)
+    try:
+        used = cache.incr(key, cost)
+    except ValueError:
+        # The window expired between add() and incr()
+        cache.add(key, 0, period * 2)
+        used = cache.incr(key, cost)
+
+    if used > limit:
+        # Give the tokens back so a refused background call doesn't starve interactive ones
+        cache.decr(key, cost)
+        raise QuotaExceeded(bucket, priority, retry_after)
+
+
+def exhaust(bucket):
+    """Mark the current window as used up (e.g. after the upstream answered 429)"""
+    calls, period = _bucket_config(bucket)
+    key, retry_after = _window(bucket)
+    cache.set(key, calls, period * 2)
+
+
+def remaining(bucket, priority=INTERACTIVE):
+    """Tokens left in the current window for a priority class"""
+    calls, period = _bucket_config(bucket)
+    key, retry_after = _window(bucket)
+    return max(0, int(calls * settings.UPSTREAM_PRIORITY_SHARES[priority]) - (cache.get(key) or 0))
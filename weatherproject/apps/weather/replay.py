@@ -0,0 +1,170 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+import requests
+from requests.structures import CaseInsensitiveDict
+from django.conf import settings
+from .exceptions import QuotaExceeded, ReplayMiss
+
+logger = logging.getLogger(__name__)
+
+# Upstream modes (WEATHER_UPSTREAM_MODE)
+LIVE = 'live'          # Plain upstream calls
+RECORD = 'record'      # Upstream calls, successful responses saved to the store
+REPLAY = 'replay'      # Recorded responses only; nothing goes upstream or uses quota
+FALLBACK = 'fallback'  # Like record, but serve the recording when upstream fails
+MODES = (LIVE, RECORD, REPLAY, FALLBACK)
+
+REPLAY_HEADER = 'X-Upstream-Replay'
+
+
+def get_mode():
+    mode = getattr(settings, 'WEATHER_UPSTREAM_MODE', LIVE)
+    if mode not in MODES:
+        raise ValueError(f"WEATHER_UPSTREAM_MODE must be one of: {', '.join(MODES)}")
+    return mode
+
+
+def _normalize_value(value):
+    if isinstance(value, (list, tuple)):
+        return ','.join(_normalize_value(item) for item in value)
+    try:
+        # 59.9, "59.90" and "59.9000" are the same coordinate
+        return f"{float(value):.4f}".rstrip('0').rstrip('.')
+    except (TypeError, ValueError):
+        return str(value)
+
+
+def _is_ignored(name):
+    return name.lower() in {ignored.lower() for ignored in settings.WEATHER_REPLAY_IGNORED_PARAMS}
+
+
+def request_key(url, params=None):
+    """Host, path and sorted query of a GET, without credentials or the other
+    WEATHER_REPLAY_IGNORED_PARAMS, so equivalent requests share one recording"""
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True) + list((params or {}).items())
+    normalized = sorted(
+        (name, _normalize_value(value)) for name, value in query if not _is_ignored(name)
+    )
+    return f"{parts.netloc.lower()}{parts.path}?{urlencode(normalized)}"
+
+
+def redact_url(url):
+    """A URL without its WEATHER_REPLAY_IGNORED_PARAMS (API keys never reach the store)"""
+    parts = urlsplit(url)
+    query = [(name, value) for name, value in parse_qsl(parts.query, keep_blank_values=True) if not _is_ignored(name)]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+class ResponseStore:
+    """Recorded upstream responses in one SQLite file, indexed by request key.
+
+    Bodies are zlib-compressed; a recording replaces the previous one for the
+    same key. Each thread gets its own connection, and WAL lets web and Celery
+    processes read and record concurrently.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                ' key TEXT PRIMARY KEY, url TEXT NOT NULL, status INTEGER NOT NULL,'
+                ' content_type TEXT, body BLOB NOT NULL, recorded_at REAL NOT NULL)'
+            )
+            self._local.connection = connection
+        return connection
+
+    def put(self, key, response):
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)',
+                (key, redact_url(response.url or ''), response.status_code, response.headers.get('Content-Type'),
+                 zlib.compress(response.content), time.time())
+            )
+
+    def get(self, key):
+        """The recorded response for a key as a requests.Response, or None"""
+        row = self._connection().execute(
+            'SELECT url, status, content_type, body, recorded_at FROM responses WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        url, status_code, content_type, body, recorded_at = row
+        response = requests.Response()
+        response.status_code = status_code
+        response.url = url
+        response._content = zlib.decompress(body)
+        response.encoding = 'utf-8'
+        response.headers = CaseInsensitiveDict({
+            'Content-Type': content_type or 'application/json',
+            REPLAY_HEADER: f"recorded {time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(recorded_at))}",
+        })
+        return response
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    with _store_lock:
+        if _store is None or _store.path != settings.WEATHER_REPLAY_STORE:
+            _store = ResponseStore(settings.WEATHER_REPLAY_STORE)
+        return _store
+
+
+def send(url, params, live_call):
+    """Run an upstream GET according to WEATHER_UPSTREAM_MODE.
+
+    `live_call` makes the real request (including any quota check). In replay
+    mode it is never called and a missing recording raises ReplayMiss; in
+    fallback mode connection errors, 5xx/429 answers and an exhausted quota are
+    answered from the recording when there is one.
+    """
+    mode = get_mode()
+    if mode == LIVE:
+        return live_call()
+
+    store = get_store()
+    key = request_key(url, params)
+    if mode == REPLAY:
+        response = store.get(key)
+        if response is None:
+            raise ReplayMiss(key)
+        return response
+
+    try:
+        response = live_call()
+    except (requests.RequestException, QuotaExceeded) as e:
+        recorded = store.get(key) if mode == FALLBACK else None
+        if recorded is None:
+            raise
+        logger.warning(f"Upstream unavailable ({str(e)}), serving recorded response for {key}")
+        return recorded
+
+    if response.ok:
+        store.put(key, response)
+    elif mode == FALLBACK and (response.status_code >= 500 or response.status_code == 429):
+        recorded = store.get(key)
+        if recorded is not None:
+            logger.warning(f"Upstream answered {response.status_code}, serving recorded response for {key}")
+            return recorded
+    return response
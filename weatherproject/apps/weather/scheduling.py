@@ -0,0 +1,114 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from .caching import make_key
+from .grid import group_by_cell
+from .analytics import record_search, search_counts
+from .models import Location
+
+
+def _hour(now=None):
+    return int((now or timezone.now()).timestamp() // 3600)
+
+
+def record_hit(location_id):
+    """Count a request served for a location (feeds the refresh scheduler).
+
+    Hourly counts only live for the hit window, so a separate marker remembers
+    that the location was requested at all within WEATHER_DORMANT_AFTER_DAYS.
+    """
+    key = make_key('hits', _hour(), location_id)
+    cache.add(key, 0, (settings.WEATHER_HIT_WINDOW_HOURS + 1) * 3600)
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass
+    cache.set(make_key('seen', location_id), True, settings.WEATHER_DORMANT_AFTER_DAYS * 24 * 3600)
+
+
+def record_usage(request, location_id, search=True):
+    """Count a request for a location: a hit for the refresh scheduler and, for a
+    signed-in user, a search. The request remembers it so conditional_get can
+    count 304 revalidations the same way."""
+    usage = getattr(request, 'weather_usage', None)
+    if usage is None:
+        usage = request.weather_usage = {}
+    usage[location_id] = usage.get(location_id, False) or search
+
+    record_hit(location_id)
+    if search and request.user.is_authenticated:
+        record_search(request.user, location_id)
+
+
+def location_scores(locations, now=None):
+    """Popularity of each location -> ({id: score}, {ids active recently}).
+
+    The score is the number of searches in the last 24 hours plus the request
+    hits of the last WEATHER_HIT_WINDOW_HOURS. Locations not searched or hit
+    within WEATHER_DORMANT_AFTER_DAYS (searches from the history, hits from the
+    'seen' markers set by record_hit) are left out of the active set.
+    """
+    now = now or timezone.now()
+    ids = [location.id for location in locations]
+
+    scores = dict.fromkeys(ids, 0)
+    for location_id, searches in search_counts(now - timedelta(hours=24)).items():
+        if location_id in scores:
+            scores[location_id] += searches
+
+    hours = range(_hour(now) - settings.WEATHER_HIT_WINDOW_HOURS + 1, _hour(now) + 1)
+    hit_keys = {make_key('hits', hour, location_id): location_id for hour in hours for location_id in ids}
+    for key, hits in cache.get_many(list(hit_keys)).items():
+        scores[hit_keys[key]] += hits
+
+    active = {location_id for location_id, score in scores.items() if score}
+    active.update(search_counts(now - timedelta(days=settings.WEATHER_DORMANT_AFTER_DAYS)))
+    seen_keys = {make_key('seen', location_id): location_id for location_id in ids}
+    active.update(seen_keys[key] for key in cache.get_many(list(seen_keys)))
+    return scores, active
+
+
+def refresh_interval(score):
+    """Seconds between refreshes for a popularity score (tiers from settings)"""
+    for name, min_score, interval in settings.WEATHER_REFRESH_TIERS:
+        if score >= min_score:
+            return interval
+    return None
+
+
+def mark_refreshed(cell_key, now=None):
+    timeout = settings.WEATHER_DORMANT_AFTER_DAYS * 24 * 3600
+    cache.set(make_key('refreshed', cell_key), (now or timezone.now()).timestamp(), timeout)
+
+
+def plan_refresh(budget=None, now=None):
+    """Grid cells to refresh this run, most popular first.
+
+    A cell is due once its hottest member's tier interval has passed since the
+    last refresh; dormant locations are never refreshed. At most `budget` cells
+    (one upstream call each) are returned.
+    Returns [(cell_key, (lat, lon), [locations])].
+    """
+    now = now or timezone.now()
+    budget = settings.WEATHER_REFRESH_BUDGET if budget is None else budget
+
+    locations = list(Location.objects.all())
+    scores, active = location_scores(locations, now)
+    cells = group_by_cell([location for location in locations if location.id in active])
+    last_refreshed = cache.get_many([make_key('refreshed', cell_key) for cell_key in cells])
+
+    due = []
+    for cell_key, (center, members) in cells.items():
+        score = sum(scores[location.id] for location in members)
+        interval = refresh_interval(max(scores[location.id] for location in members))
+        refreshed_at = last_refreshed.get(make_key('refreshed', cell_key))
+        if interval is None:
+            continue
+        if refreshed_at is not None and now.timestamp() - refreshed_at < interval:
+            continue
+        due.append((-score, refreshed_at or 0, cell_key, center, members))
+
+    # Most popular first, then the longest unrefreshed
+    due.sort(key=lambda cell: cell[:2])
+    return [(cell_key, center, members) for _, _, cell_key, center, members in due[:budget]]
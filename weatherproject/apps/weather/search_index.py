@@ -0,0 +1,236 @@
+import bisect
+import heapq
+import logging
+import threading
+import time
+import unicodedata
+from datetime import timedelta
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from .analytics import search_counts
+from .models import Location
+
+logger = logging.getLogger(__name__)
+
+# Prefixes up to this length match too many names to rank on the fly, so their
+# best matches are kept precomputed
+SHORT_PREFIX = 2
+SHORT_PREFIX_TOP = 50
+# Longer prefixes matching more entries than this have their ranking memoised
+BROAD_PREFIX_MATCHES = 500
+
+
+def normalize(text):
+    """Lower-case, strip accents and collapse whitespace ("São  Paulo" -> "sao paulo")"""
+    text = unicodedata.normalize('NFKD', text or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(text.lower().split())
+
+
+class LocationIndex:
+    """In-memory prefix index over Location.name and country for autocomplete.
+
+    Every location is indexed under its full name, each word of its name and its
+    country, in one sorted list of (term, id) pairs. A prefix query is two bisects
+    plus a top-k by popularity over the matching slice; one- and two-letter
+    prefixes are answered from precomputed lists and very common prefixes from
+    a memo that is dropped whenever a location is added.
+    """
+
+    def __init__(self):
+        self._terms = []
+        self._locations = {}
+        self._popularity = {}
+        self._short = {}
+        self._broad = {}
+        self._max_id = 0
+        self._lock = threading.Lock()
+        self.built_at = time.monotonic()
+        self.synced_at = self.built_at
+
+    @classmethod
+    def build(cls):
+        """Index every location, ranked by searches in the popularity window"""
+        index = cls()
+        since = timezone.now() - timedelta(days=settings.WEATHER_AUTOCOMPLETE_POPULARITY_DAYS)
+        popularity = search_counts(since)
+        by_prefix = {}
+        locations = Location.objects.only('id', 'name', 'country', 'latitude', 'longitude')
+        for location in locations.iterator(chunk_size=2000):
+            terms = index._insert(location, popularity.get(location.id, 0))
+            index._terms.extend((term, location.id) for term in terms)
+            for prefix in index._prefixes(terms):
+                by_prefix.setdefault(prefix, []).append(location.id)
+        index._terms.sort()
+        index._short = {
+            prefix: heapq.nlargest(SHORT_PREFIX_TOP, ids, key=index._rank)
+            for prefix, ids in by_prefix.items()
+        }
+        return index
+
+    def add(self, location, popularity=None):
+        """Add or update one location without rebuilding"""
+        with self._lock:
+            old = self._locations.get(location.id)
+            if old and (old['name'], old['country']) == (location.name, location.country):
+                # Same terms (e.g. only the coordinates moved)
+                old.update(latitude=location.latitude, longitude=location.longitude)
+                return
+            if old:
+                self._remove(location.id)
+            if popularity is None:
+                popularity = self._popularity.get(location.id, 0)
+            terms = self._insert(location, popularity)
+            self._broad = {}
+            for term in terms:
+                bisect.insort(self._terms, (term, location.id))
+            for prefix in self._prefixes(terms):
+                top = self._short.setdefault(prefix, [])
+                top.append(location.id)
+                top.sort(key=self._rank, reverse=True)
+                del top[SHORT_PREFIX_TOP:]
+
+    def remove(self, location_id):
+        with self._lock:
+            if location_id in self._locations:
+                self._remove(location_id)
+                self._broad = {}
+
+    def sync(self):
+        """Pick up locations created by other processes since the last sync"""
+        self.synced_at = time.monotonic()
+        for location in Location.objects.filter(id__gt=self._max_id).order_by('id'):
+            self.add(location)
+
+    def search(self, query, limit=10):
+        query = normalize(query)
+        if not query:
+            return []
+
+        if len(query) <= SHORT_PREFIX:
+            ids = self._short.get(query, [])
+        elif query in self._broad:
+            ids = self._broad[query]
+        else:
+            start = bisect.bisect_left(self._terms, (query,))
+            end = bisect.bisect_left(self._terms, (query + '\uffff',))
+            matches = {location_id for term, location_id in self._terms[start:end]}
+            ids = heapq.nlargest(max(limit, SHORT_PREFIX_TOP), matches, key=self._rank)
+            if end - start > BROAD_PREFIX_MATCHES:
+                # Common words ("city", a country) match thousands of names; rank them once
+                self._broad[query] = ids
+
+        return [self._locations[location_id] for location_id in ids[:limit]]
+
+    def __len__(self):
+        return len(self._locations)
+
+    def _rank(self, location_id):
+        # Ties go to the shorter (usually better known) name
+        return self._popularity[location_id], -len(self._locations[location_id]['name'])
+
+    def _terms_for(self, name, country):
+        name = normalize(name)
+        terms = {name, normalize(country)}
+        terms.update(name.split())
+        terms.discard('')
+        return terms
+
+    def _prefixes(self, terms):
+        return {term[:length] for term in terms for length in range(1, SHORT_PREFIX + 1)}
+
+    def _insert(self, location, popularity):
+        """Record a location and return its terms (callers add them to _terms)"""
+        self._locations[location.id] = {
+            'id': location.id,
+            'name': location.name,
+            'country': location.country,
+            'latitude': location.latitude,
+            'longitude': location.longitude,
+        }
+        self._popularity[location.id] = popularity
+        self._max_id = max(self._max_id, location.id)
+        return self._terms_for(location.name, location.country)
+
+    def _remove(self, location_id):
+        old = self._locations.pop(location_id)
+        self._terms = [entry for entry in self._terms if entry[1] != location_id]
+        for prefix in self._prefixes(self._terms_for(old['name'], old['country'])):
+            if location_id in self._short.get(prefix, []):
+                self._short[prefix].remove(location_id)
+
+
+_index = None
+_index_lock = threading.Lock()
+# Saves and deletes seen while a replacement index is being built (None: no
+# rebuild running); they are replayed onto it before it is swapped in
+_pending = None
+
+
+def get_location_index():
+    """Process-wide index, synced with new locations at most once a second.
+
+    Every WEATHER_AUTOCOMPLETE_REBUILD_SECONDS (to refresh popularity) a
+    replacement is built in a background thread while the current index keeps
+    answering; only the very first build happens on the request thread.
+    """
+    global _index
+    now = time.monotonic()
+    with _index_lock:
+        if _index is None:
+            _index = LocationIndex.build()
+        elif now - _index.built_at > settings.WEATHER_AUTOCOMPLETE_REBUILD_SECONDS and _pending is None:
+            _start_rebuild()
+        if now - _index.synced_at > 1:
+            _index.sync()
+        return _index
+
+
+def _start_rebuild():
+    global _pending
+    _pending = []
+    threading.Thread(target=_rebuild, name='location-index-rebuild', daemon=True).start()
+
+
+def _rebuild():
+    global _index, _pending
+    try:
+        index = LocationIndex.build()
+    except Exception as e:
+        logger.error(f"Location index rebuild failed: {str(e)}")
+        index = None
+    finally:
+        # The thread's own database connection
+        connection.close()
+
+    with _index_lock:
+        if index is None:
+            # Keep the current index and try again after another interval
+            _index.built_at = time.monotonic()
+        else:
+            for saved, instance in _pending:
+                if saved:
+                    index.add(instance)
+                else:
+                    index.remove(instance.id)
+            _index = index
+        _pending = None
+
+
+def location_saved(sender, instance, **kwargs):
+    """post_save hook: update this process's index right away"""
+    with _index_lock:
+        if _index is not None:
+            _index.add(instance)
+        if _pending is not None:
+            _pending.append((True, instance))
+
+
+def location_deleted(sender, instance, **kwargs):
+    """post_delete hook: drop merged or deleted locations from this process's index"""
+    with _index_lock:
+        if _index is not None:
+            _index.remove(instance.id)
+        if _pending is not None:
+            _pending.append((False, instance))
@@ -1,45 +1,203 @@
 from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
+from datetime import datetime, timedelta, timezone as dt_timezone
 from utilities.api_clients import OpenWeatherClient
-from .models import WeatherData, Location
+from .models import WeatherData, Location, LocationSearchCount
+from .caching import make_key, store
+from .scheduling import plan_refresh, mark_refreshed
+from .exceptions import QuotaExceeded
+from . import profiling, quota, upstream
+from .grid import group_by_cell
 import logging
+import time
+import uuid
 
 logger = logging.getLogger(__name__)
 
 @shared_task
-def fetch_current_weather():
-    """Fetch current weather for all locations"""
-    client = OpenWeatherClient()
-    for location in Location.objects.all():
+def fetch_16_day_forecast():
+    """Fetch 16-day forecast (including today), one upstream call per grid cell"""
+    client = OpenWeatherClient(quota.BACKGROUND)
+    for cell_key, ((lat, lon), locations) in group_by_cell(Location.objects.all()).items():
         try:
-            weather_data = client.get_current_weather(
-                lat=location.latitude,
-                lon=location.longitude
-            )
-            WeatherData.objects.update_or_create(
-                location=location,
-                timestamp=weather_data['timestamp'],
-                defaults=weather_data
-            )
+            forecasts = client.get_16_day_forecast(lat=lat, lon=lon)
+        except QuotaExceeded as e:
+            logger.warning(f"Forecast refresh stopped at cell {cell_key}: {str(e)}")
+            break
         except Exception as e:
-            logger.error(f"Current weather fetch failed for {location.name}: {str(e)}")
+            logger.error(f"Forecast fetch failed for cell {cell_key}: {str(e)}")
+            continue
+        for location in locations:
+            try:
+                for forecast in forecasts:
+                    WeatherData.objects.update_or_create(
+                        location=location,
+                        timestamp=forecast['timestamp'],
+                        is_forecast=True,
+                        defaults=forecast
+                    )
+            except Exception as e:
+                logger.error(f"Forecast save failed for {location.name}: {str(e)}")
 
 @shared_task
-def fetch_16_day_forecast():
-    """Fetch 16-day forecast (including today)"""
-    client = OpenWeatherClient()
-    for location in Location.objects.all():
+def refresh_popular_locations():
+    """Refresh current conditions for the locations people actually look at.
+
+    Hot locations are refreshed every run, warm and cold ones less often and
+    dormant ones not at all, with at most WEATHER_REFRESH_BUDGET upstream calls
+    per run (see scheduling.plan_refresh). Calls wait for the background quota
+    to refill rather than giving up, for up to WEATHER_REFRESH_MAX_SECONDS.
+    Each refresh updates the request cache used by CurrentWeatherAPI and
+    records a WeatherData row.
+    """
+    from .views import CurrentWeatherAPI, current_conditions_key
+
+    api = CurrentWeatherAPI()
+    refreshed = 0
+    deadline = time.monotonic() + settings.WEATHER_REFRESH_MAX_SECONDS
+    for cell_key, (lat, lon), locations in plan_refresh():
         try:
-            forecasts = client.get_16_day_forecast(
-                lat=location.latitude,
-                lon=location.longitude
-            )
-            for forecast in forecasts:
+            weather = _paced(lambda: api._fetch_current_conditions(lat, lon, quota.BACKGROUND), deadline)
+        except QuotaExceeded as e:
+            logger.warning(f"Adaptive refresh stopped at cell {cell_key}: {str(e)}")
+            break
+        except Exception as e:
+            logger.error(f"Adaptive refresh failed for cell {cell_key}: {str(e)}")
+            continue
+
+        mark_refreshed(cell_key)
+        refreshed += 1
+        store(
+            current_conditions_key(cell_key), weather,
+            settings.WEATHER_CURRENT_CACHE_TIMEOUT, settings.WEATHER_STALE_CACHE_TIMEOUT
+        )
+        timestamp = datetime.fromtimestamp(weather['dt'], tz=dt_timezone.utc)
+        for location in locations:
+            try:
                 WeatherData.objects.update_or_create(
                     location=location,
-                    timestamp=forecast['timestamp'],
-                    is_forecast=True,
-                    defaults=forecast
+                    timestamp=timestamp,
+                    is_forecast=False,
+                    defaults={
+                        'temperature': weather['main']['temp'],
+                        'humidity': weather['main']['humidity'],
+                        'wind_speed': weather['wind']['speed'],
+                        'weather_type': api._map_weather_type(weather['weather'][0]['main'])
+                    }
                 )
-        except Exception as e:
-            logger.error(f"Forecast fetch failed for {location.name}: {str(e)}")
\ No newline at end of file
+            except Exception as e:
+                logger.error(f"Adaptive refresh save failed for {location.name}: {str(e)}")
+    return refreshed
+
+def _paced(call, deadline):
+    """Run an upstream call, sleeping through QuotaExceeded until `deadline`"""
+    while True:
+        try:
+            return call()
+        except QuotaExceeded as e:
+            wait = max(e.retry_after, 1)
+            if time.monotonic() + wait > deadline:
+                raise
+            time.sleep(wait)
+
+
+@shared_task
+def prune_search_counts():
+    """Drop hourly search counters older than WEATHER_SEARCH_COUNT_RETENTION_DAYS"""
+    cutoff = timezone.now() - timedelta(days=settings.WEATHER_SEARCH_COUNT_RETENTION_DAYS)
+    deleted, _ = LocationSearchCount.objects.filter(hour__lt=cutoff).delete()
+    return deleted
+
+@shared_task
+def warm_caches(limit=None, concurrency=None, only_if_cold=False):
+    """Warm the caches for the most searched locations (see warmup.warm_caches).
+
+    Scheduled with only_if_cold=True it does nothing until the cache has been
+    flushed, and it is postponed to the next run while no background quota is
+    left. ARIMA fits are queued on the forecasting workers instead of run here.
+    """
+    from . import warmup
+
+    if only_if_cold and warmup.warmup_status() is not None:
+        return None
+    if quota.remaining(upstream.OPENWEATHER, quota.BACKGROUND) == 0:
+        logger.warning("Cache warm-up postponed: no background quota left")
+        return None
+    return warmup.warm_caches(limit, concurrency, arima=warmup.ARIMA_QUEUE)
+
+@shared_task
+def refit_forecasts(location_ids=None, engine_name=None):
+    """Fit today's forecasts for many locations in one batch (see
+    ARIMAForecastAPI._forecast_cells), by default the most searched ones.
+
+    Scheduled just after midnight, when the daily forecast keys roll over, and
+    queued by the cache warm-up.
+    """
+    from .forecasting import get_engine
+    from .views import ARIMAForecastAPI
+    from .warmup import top_locations
+
+    engine = get_engine(engine_name)
+    if location_ids is None:
+        locations = top_locations(settings.WEATHER_WARMUP_LOCATIONS)
+    else:
+        locations = list(Location.objects.filter(pk__in=location_ids))
+    return ARIMAForecastAPI()._forecast_cells(locations, engine)
+
+@shared_task(bind=True)
+def generate_forecast(self, location_id, engine_name=None, variables=None, steps=None):
+    """Fit the ARIMA (or other engine) forecast for a location.
+
+    Routed to the dedicated 'forecasting' queue so CPU-heavy fits never run in
+    a web worker.
+    """
+    from .forecasting import FORECAST_STEPS, FORECAST_VARIABLES, get_engine
+    from .views import ARIMAForecastAPI
+
+    engine = get_engine(engine_name)
+    variables = variables or list(FORECAST_VARIABLES)
+    steps = steps or FORECAST_STEPS
+    try:
+        location = Location.objects.get(pk=location_id)
+        if not settings.WEATHER_PROFILE_FITS:
+            return ARIMAForecastAPI()._build_forecast(location, engine, variables, steps) or ARIMAForecastAPI.insufficient_history_error
+        
+        started = time.perf_counter()
+        with profiling.collect_fits() as fits:
+            forecast = ARIMAForecastAPI()._build_forecast(location, engine, variables, steps)
+        profiling.save_report('task', f"generate_forecast {location.name} ({engine.name})", time.perf_counter() - started, fits)
+        return forecast or ARIMAForecastAPI.insufficient_history_error
+    finally:
+        # Let the next request start a fresh job (the result itself is cached by then)
+        job_key = _forecast_job_key(location_id, engine.name, variables, steps)
+        if cache.get(job_key) == self.request.id:
+            cache.delete(job_key)
+
+def _forecast_job_key(location_id, engine_name, variables, steps):
+    return make_key('forecast_job', engine_name, location_id, '+'.join(variables), steps)
+
+def submit_forecast_job(location_id, engine_name, variables=None, steps=None):
+    """Start a forecast job, or join the one already running for this location
+    and selection of variables and horizon"""
+    from .forecasting import FORECAST_STEPS, FORECAST_VARIABLES
+
+    variables = list(variables or FORECAST_VARIABLES)
+    steps = steps or FORECAST_STEPS
+    job_key = _forecast_job_key(location_id, engine_name, variables, steps)
+    for _ in range(2):
+        task_id = str(uuid.uuid4())
+        # cache.add is atomic, so concurrent requests agree on a single job
+        if cache.add(job_key, task_id, settings.ARIMA_FORECAST_JOB_TIMEOUT):
+            try:
+                return generate_forecast.apply_async(args=[location_id, engine_name, variables, steps], task_id=task_id)
+            except Exception:
+                # Never enqueued (e.g. broker down): don't let later requests join it
+                cache.delete(job_key)
+                raise
+        existing_id = cache.get(job_key)
+        if existing_id:
+            return generate_forecast.AsyncResult(existing_id)
+    # The running job finished between add() and get(); start our own
+    return generate_forecast.apply_async(args=[location_id, engine_name, variables, steps])
@@ -0,0 +1,211 @@
+from datetime import timedelta
+from unittest import mock
+import numpy as np
+import pandas as pd
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.permissions import AllowAny
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework.views import APIView
+from . import quota, replay, upstream
+from .conditional import conditional_get
+from .exceptions import QuotaExceeded
+from .export import iter_weather_rows
+from .forecasting import FORECAST_VARIABLES, VectorizedEngine
+from .grid import snap_to_grid
+from .models import Location, WeatherData
+from .scheduling import record_usage
+
+
+def ar_series(coefficients, intercept, n_points, seed):
+    """A random walk whose daily changes follow an AR(p) process"""
+    rng = np.random.default_rng(seed)
+    lags = len(coefficients)
+    changes = np.zeros(n_points)
+    for t in range(lags, n_points):
+        recent = changes[t - lags:t][::-1]
+        changes[t] = intercept + np.dot(coefficients, recent) + rng.normal(0, 0.01)
+    return np.cumsum(changes), changes
+
+
+def expected_forecast(values, changes, coefficients, intercept, steps):
+    """Noise-free continuation of ar_series with its true coefficients"""
+    changes = list(changes)
+    level = values[-1]
+    forecast = []
+    for _ in range(steps):
+        change = intercept + np.dot(coefficients, changes[::-1][:len(coefficients)])
+        changes.append(change)
+        level += change
+        forecast.append(level)
+    return np.array(forecast)
+
+
+class VectorizedEngineTests(SimpleTestCase):
+    def test_predict_matrix_recovers_known_ar_processes(self):
+        engine = VectorizedEngine(lags=2, season=1, ridge=1e-6)
+        processes = [([0.6, -0.2], 0.5), ([0.3, 0.1], -0.2)]
+        series = [ar_series(coefficients, intercept, 2000, seed) for seed, (coefficients, intercept) in enumerate(processes)]
+
+        predictions = engine.predict_matrix(np.vstack([values for values, _ in series]), steps=5)
+
+        # Both rows share one batched solve but keep their own coefficients
+        for row, ((values, changes), (coefficients, intercept)) in enumerate(zip(series, processes)):
+            expected = expected_forecast(values, changes, coefficients, intercept, 5)
+            np.testing.assert_allclose(predictions[row], expected, atol=0.05)
+
+    def test_short_history_only_fails_its_own_location(self):
+        rng = np.random.default_rng(0)
+        long_history = pd.DataFrame({column: rng.normal(10, 2, 60) for column in FORECAST_VARIABLES})
+        short_history = pd.DataFrame({column: rng.normal(10, 2, 10) for column in FORECAST_VARIABLES})
+
+        long_result, short_result = VectorizedEngine().forecast_many([long_history, short_history])
+
+        self.assertEqual(set(long_result[2].values()), {"trained"})
+        self.assertEqual(set(short_result[2].values()), {"failed"})
+        self.assertEqual(len(long_result[0]['temperature_max']), 7)
+
+
+class SnapToGridTests(SimpleTestCase):
+    def test_points_on_cell_edges_belong_to_the_cell_above(self):
+        for lat, row in [(0.3, 3), (0.6, 6), (0.7, 7), (1.0, 10), (40.8, 408), (-0.3, -3)]:
+            key, center_lat, _ = snap_to_grid(lat, 10.75, size=0.1)
+            self.assertEqual(key.split(':')[1], str(row), lat)
+            self.assertAlmostEqual(center_lat, (row + 0.5) * 0.1)
+
+    def test_points_inside_one_cell_share_its_key(self):
+        self.assertEqual(snap_to_grid(40.71, -74.01, size=0.1)[0], snap_to_grid(40.79, -74.09, size=0.1)[0])
+
+    def test_grid_off_keeps_exact_coordinates(self):
+        self.assertEqual(snap_to_grid(40.7128, -74.006, size=0), ("40.7128,-74.0060", 40.7128, -74.006))
+
+
+class CityWeatherView(APIView):
+    """A minimal weather view: counts a search for location 7"""
+    permission_classes = [AllowAny]
+
+    @conditional_get(max_age=60)
+    def get(self, request, city_name):
+        record_usage(request, 7)
+        return Response({"city": city_name, "temperature": 12.5, "generated_at": timezone.now().isoformat()})
+
+
+class ConditionalGetTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.factory = APIRequestFactory()
+        self.view = CityWeatherView.as_view()
+
+    def test_matching_etag_gets_304_and_replays_usage(self):
+        first = self.view(self.factory.get('/weather/oslo/'), city_name='oslo')
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('ETag', first)
+
+        with mock.patch('apps.weather.conditional.record_usage') as replayed:
+            second = self.view(self.factory.get('/weather/oslo/', HTTP_IF_NONE_MATCH=first['ETag']), city_name='oslo')
+
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second['ETag'], first['ETag'])
+        replayed.assert_called_once_with(mock.ANY, 7, True)
+
+    def test_other_etag_or_query_gets_the_full_response(self):
+        first = self.view(self.factory.get('/weather/oslo/'), city_name='oslo')
+
+        stale = self.view(self.factory.get('/weather/oslo/', HTTP_IF_NONE_MATCH='"outdated"'), city_name='oslo')
+        other_query = self.view(
+            self.factory.get('/weather/oslo/', {'units': 'imperial'}, HTTP_IF_NONE_MATCH=first['ETag']), city_name='oslo'
+        )
+
+        self.assertEqual(stale.status_code, 200)
+        self.assertEqual(other_query.status_code, 200)
+
+
+class IterWeatherRowsTests(TestCase):
+    def setUp(self):
+        self.oslo = Location.objects.create(name='Oslo', latitude=59.91, longitude=10.75, country='NO')
+        self.bergen = Location.objects.create(name='Bergen', latitude=60.39, longitude=5.32, country='NO')
+        start = timezone.now().replace(microsecond=0)
+        # Three rows share each timestamp, so chunk boundaries fall inside a timestamp
+        for hour in range(3):
+            for _ in range(3):
+                WeatherData.objects.create(
+                    location=self.oslo, timestamp=start + timedelta(hours=hour),
+                    temperature=hour, humidity=50, wind_speed=3, weather_type=0
+                )
+        WeatherData.objects.create(
+            location=self.bergen, timestamp=start, temperature=8, humidity=80, wind_speed=5, weather_type=2
+        )
+
+    def test_chunks_resume_after_duplicate_timestamps(self):
+        expected = list(
+            WeatherData.objects.filter(location=self.oslo).order_by('timestamp', 'id').values_list('id', flat=True)
+        )
+
+        rows = list(iter_weather_rows([self.oslo], chunk_size=2))
+
+        self.assertEqual([row['id'] for row in rows], expected)
+        self.assertEqual({row['location'] for row in rows}, {'Oslo'})
+
+    def test_locations_are_exported_one_after_another(self):
+        rows = list(iter_weather_rows([self.oslo, self.bergen], chunk_size=4))
+
+        self.assertEqual([row['location'] for row in rows], ['Oslo'] * 9 + ['Bergen'])
+
+
+@override_settings(
+    UPSTREAM_QUOTAS={'test': {'calls': 10, 'period': 60}},
+    UPSTREAM_PRIORITY_SHARES={quota.INTERACTIVE: 1.0, quota.BACKGROUND: 0.6},
+    WEATHER_UPSTREAM_MODE='live'
+)
+class QuotaTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        # One fixed window, so the test never straddles a refill
+        patcher = mock.patch.object(quota.time, 'time', return_value=1_000_000.0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_background_share_is_refused_while_interactive_calls_go_through(self):
+        for _ in range(6):
+            quota.acquire('test', quota.BACKGROUND)
+        with self.assertRaises(QuotaExceeded) as refused:
+            quota.acquire('test', quota.BACKGROUND)
+        self.assertEqual(refused.exception.priority, quota.BACKGROUND)
+        self.assertEqual(refused.exception.retry_after, 20)
+
+        for _ in range(4):
+            quota.acquire('test', quota.INTERACTIVE)
+        with self.assertRaises(QuotaExceeded):
+            quota.acquire('test', quota.INTERACTIVE)
+
+    def test_upstream_429_exhausts_the_window(self):
+        throttled = mock.Mock(status_code=429)
+        with mock.patch.object(upstream.requests, 'get', return_value=throttled) as get:
+            self.assertIs(upstream.fetch('https://example.com/weather', bucket='test'), throttled)
+            with self.assertRaises(QuotaExceeded):
+                upstream.fetch('https://example.com/weather', bucket='test')
+        self.assertEqual(get.call_count, 1)
+
+
+@override_settings(WEATHER_REPLAY_IGNORED_PARAMS=['appid', 'start_date', 'end_date'])
+class RequestKeyTests(SimpleTestCase):
+    def test_credentials_and_dates_are_dropped(self):
+        key = replay.request_key(
+            'https://archive-api.open-meteo.com/v1/archive?appid=secret',
+            {'latitude': 59.91, 'start_date': '2026-08-20', 'end_date': '2026-10-18', 'APPID': 'other'}
+        )
+        self.assertEqual(key, 'archive-api.open-meteo.com/v1/archive?latitude=59.91')
+
+    def test_equivalent_requests_share_a_key(self):
+        self.assertEqual(
+            replay.request_key('https://API.openweathermap.org/data/2.5/weather?lon=10.750&lat=59.9&appid=a'),
+            replay.request_key('https://api.openweathermap.org/data/2.5/weather', {'lat': '59.90', 'lon': 10.75, 'appid': 'b'})
+        )
+
+    def test_redacted_urls_keep_other_parameters(self):
+        self.assertEqual(
+            replay.redact_url('https://api.openweathermap.org/geo/1.0/direct?q=oslo&limit=1&appid=secret'),
+            'https://api.openweathermap.org/geo/1.0/direct?q=oslo&limit=1'
+        )
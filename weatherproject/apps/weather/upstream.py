@@ -0,0 +1,24 @@
+import requests
+from . import quota, replay
+
+# Quota buckets for the upstream services
+OPENWEATHER = 'openweather'
+OPEN_METEO = 'open-meteo'
+
+
+def fetch(url, params=None, bucket=OPENWEATHER, priority=quota.INTERACTIVE, timeout=10):
+    """GET an upstream URL after taking a token from its shared quota bucket.
+
+    Raises quota.QuotaExceeded instead of calling out when the budget for this
+    priority is used up. The call goes through the record/replay store
+    (WEATHER_UPSTREAM_MODE), so replayed requests spend no quota and fallback
+    mode can answer from a recording when the quota runs out.
+    """
+    def live_call():
+        quota.acquire(bucket, priority)
+        response = requests.get(url, params=params, timeout=timeout)
+        if response.status_code == 429:
+            quota.exhaust(bucket)
+        return response
+
+    return replay.send(url, params, live_call)
@@ -1,19 +1,52 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
+from django.core.cache import cache
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.urls import reverse
 from django.utils import timezone
-from datetime import timedelta
-from .models import WeatherData, Location, UserSearchHistory
+from django.utils.cache import patch_cache_control
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import datetime, time, timedelta
+from .models import WeatherData, Location, UserSearchHistory, ProfileReport
 from .serializers import WeatherDataSerializer, LocationSerializer 
-import requests
+from .caching import make_key, get_or_compute, store
+from .grid import snap_to_grid
+from .conditional import conditional_get
+from .export import EXPORT_FORMATS, iter_weather_rows
+from .exceptions import QuotaExceeded, ReplayMiss
+from .scheduling import record_usage
+from .search_index import SHORT_PREFIX_TOP, get_location_index
+from .locations import get_or_create_location
+from .analytics import popular_locations
+from .warmup import is_ready, warmup_status
+from .profiling import collecting_fits
+from . import quota, upstream
 from django.conf import settings
-import pandas as pd
-import numpy as np
-from statsmodels.tsa.arima.model import ARIMA
-from statsmodels.tsa.statespace.sarimax import SARIMAX
-import warnings
-warnings.filterwarnings('ignore')
+from .forecasting import FORECAST_STEPS, FORECAST_VARIABLES, get_engine, select_steps, select_variables
+import copy
+
+def quota_exceeded_response(error):
+    """503 with Retry-After when the upstream budget is spent and nothing is cached"""
+    return Response(
+        {"error": "Weather service is busy, please retry shortly", "retry_after": error.retry_after},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": str(error.retry_after)}
+    )
+
+def replay_miss_response(error):
+    """503 naming the request that has no recording (WEATHER_UPSTREAM_MODE=replay)"""
+    return Response(
+        {"error": "No recorded upstream response for this request", "missing_key": error.key},
+        status=status.HTTP_503_SERVICE_UNAVAILABLE
+    )
+
+def current_conditions_key(cell_key):
+    """Cache key of the raw OWM current conditions for a grid cell (see snap_to_grid);
+    the views and refresh_popular_locations both fetch them at the cell centre"""
+    return make_key('owm_current', cell_key)
 
 class LocationListAPI(APIView):
     permission_classes = [AllowAny]
@@ -24,9 +57,25 @@ class LocationListAPI(APIView):
         serializer = LocationSerializer(locations, many=True)
         return Response(serializer.data)
 
+class LocationAutocompleteAPI(APIView):
+    permission_classes = [AllowAny]
+    
+    def get(self, request):
+        """Suggest known locations for a name or country prefix (?q=, ?limit=)"""
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 10)), SHORT_PREFIX_TOP))
+        except ValueError:
+            return Response({"error": "limit must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        suggestions = get_location_index().search(request.query_params.get('q', ''), limit)
+        response = Response(suggestions)
+        patch_cache_control(response, public=True, max_age=settings.WEATHER_AUTOCOMPLETE_CACHE_TIMEOUT)
+        return response
+
 class CurrentWeatherAPI(APIView):
     permission_classes = [AllowAny]
 
+    @conditional_get(max_age=settings.WEATHER_CURRENT_CACHE_TIMEOUT)
     def get(self, request, city_name):
         # Validate city_name parameter
         if not city_name or not city_name.strip():
@@ -44,53 +93,47 @@ class CurrentWeatherAPI(APIView):
             
             # Optionally save to database if needed
             if request.user.is_authenticated:
-                self._save_to_database(city_name, weather_data)
+                location = self._save_to_database(city_name, weather_data)
+            else:
                 location = self._get_or_create_location(city_name, weather_data)
-                UserSearchHistory.objects.create(
-                    user=request.user,
-                    location=location,
-                    via_api=True
-                )
+            # Anonymous traffic counts towards refresh popularity too
+            record_usage(request, location.id)
             
             return Response(weather_data)
             
+        except QuotaExceeded as e:
+            return quota_exceeded_response(e)
+        except ReplayMiss as e:
+            return replay_miss_response(e)
         except Exception as e:
             return Response(
                 {"error": f"Could not fetch weather data: {str(e)}"},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-    def _fetch_weather_data(self, city_name):
+    def _fetch_weather_data(self, city_name, priority=quota.INTERACTIVE):
         """Fetch live weather data from OpenWeatherMap"""
         try:
-            # First get coordinates
-            geo_url = f"http://api.openweathermap.org/geo/1.0/direct?q={city_name}&limit=1&appid={settings.WEATHER_API_KEY}"
-            geo_response = requests.get(geo_url, timeout=10)
-            
-            if geo_response.status_code != 200:
-                raise ValueError(f"Geocoding API error: {geo_response.status_code}")
-                
-            geo_data = geo_response.json()
-            
-            if not geo_data:
-                raise ValueError("City not found")
-            
-            # Then get weather
-            weather_url = f"https://api.openweathermap.org/data/2.5/weather?lat={geo_data[0]['lat']}&lon={geo_data[0]['lon']}&appid={settings.WEATHER_API_KEY}&units=metric&lang=en"
-            weather_response = requests.get(weather_url, timeout=10)
-            
-            if weather_response.status_code != 200:
-                raise ValueError(f"Weather API error: {weather_response.status_code}")
-                
-            weather_data = weather_response.json()
+            # First get coordinates (a city's coordinates don't change, so keep them long)
+            geo_data = get_or_compute(
+                make_key('geocode', city_name.strip().lower()),
+                lambda: self._geocode(city_name, priority),
+                settings.WEATHER_GEOCODE_CACHE_TIMEOUT
+            )
             
-            # Check if weather data contains required fields
-            if 'weather' not in weather_data or 'main' not in weather_data:
-                raise ValueError("Invalid weather data received")
+            # Then get weather for its grid cell (served stale rather than failing if the quota runs out)
+            cell_key, cell_lat, cell_lon = snap_to_grid(geo_data[0]['lat'], geo_data[0]['lon'])
+            weather_data = get_or_compute(
+                current_conditions_key(cell_key),
+                lambda: self._fetch_current_conditions(cell_lat, cell_lon, priority),
+                settings.WEATHER_CURRENT_CACHE_TIMEOUT,
+                stale_timeout=settings.WEATHER_STALE_CACHE_TIMEOUT
+            )
             
             # Format the response
             return {
                 "city": city_name.title(),
+                "resolved_name": geo_data[0].get('name') or city_name.title(),
                 "country": geo_data[0].get('country', ''),
                 "coordinates": {
                     "latitude": geo_data[0]['lat'],
@@ -120,32 +163,51 @@ class CurrentWeatherAPI(APIView):
                 "last_updated": timezone.now().strftime('%Y-%m-%d %H:%M:%S')
             }
             
+        except (QuotaExceeded, ReplayMiss):
+            raise
         except Exception as e:
             raise Exception(f"Weather service error: {str(e)}")
 
+    def _geocode(self, city_name, priority=quota.INTERACTIVE):
+        """Resolve a city name with the OpenWeatherMap geocoding API"""
+        geo_url = f"http://api.openweathermap.org/geo/1.0/direct?q={city_name}&limit=1&appid={settings.WEATHER_API_KEY}"
+        geo_response = upstream.fetch(geo_url, priority=priority)
+        
+        if geo_response.status_code != 200:
+            raise ValueError(f"Geocoding API error: {geo_response.status_code}")
+            
+        geo_data = geo_response.json()
+        
+        if not geo_data:
+            raise ValueError("City not found")
+        return geo_data
+
+    def _fetch_current_conditions(self, lat, lon, priority=quota.INTERACTIVE):
+        """Fetch the raw current conditions for a point from OpenWeatherMap"""
+        weather_url = f"https://api.openweathermap.org/data/2.5/weather?lat={lat}&lon={lon}&appid={settings.WEATHER_API_KEY}&units=metric&lang=en"
+        weather_response = upstream.fetch(weather_url, priority=priority)
+        
+        if weather_response.status_code != 200:
+            raise ValueError(f"Weather API error: {weather_response.status_code}")
+            
+        weather_data = weather_response.json()
+        
+        # Check if weather data contains required fields
+        if 'weather' not in weather_data or 'main' not in weather_data:
+            raise ValueError("Invalid weather data received")
+        return weather_data
+
     def _get_or_create_location(self, city_name, weather_data):
-        """Helper to get or create location with coordinates"""
-        # Try to find existing location first
-        try:
-            location = Location.objects.get(name__iexact=city_name)
-            # Update coordinates if they've changed
-            if (abs(location.latitude - weather_data['coordinates']['latitude']) > 0.001 or
-                abs(location.longitude - weather_data['coordinates']['longitude']) > 0.001):
-                location.latitude = weather_data['coordinates']['latitude']
-                location.longitude = weather_data['coordinates']['longitude']
-                location.save()
-            return location
-        except Location.DoesNotExist:
-            # Create new location
-            return Location.objects.create(
-                name=city_name.title(),
-                latitude=weather_data['coordinates']['latitude'],
-                longitude=weather_data['coordinates']['longitude'],
-                country=weather_data['country']
-            )
+        """Helper to get or create location with coordinates (deduplicated by canonical key)"""
+        return get_or_create_location(
+            weather_data.get('resolved_name') or city_name.title(),
+            weather_data['coordinates']['latitude'],
+            weather_data['coordinates']['longitude'],
+            weather_data['country']
+        )
 
     def _save_to_database(self, city_name, weather_data):
-        """Save weather data to database"""
+        """Save weather data to database and return its location"""
         location = self._get_or_create_location(city_name, weather_data)
         
         WeatherData.objects.create(
@@ -156,6 +218,7 @@ class CurrentWeatherAPI(APIView):
             wind_speed=weather_data['wind']['speed'],
             weather_type=self._map_weather_type(weather_data['weather']['main'])
         )
+        return location
 
     def _map_weather_type(self, weather_main):
         """Map weather condition to our model"""
@@ -168,105 +231,357 @@ class CurrentWeatherAPI(APIView):
 class WeatherForecastAPI(APIView):
     permission_classes = [AllowAny]
 
+    # Fields of each forecast period, selectable with ?variables=
+    FIELDS = ['temperature', 'feels_like', 'weather', 'humidity', 'wind_speed', 'precipitation']
+    MAX_HORIZON_DAYS = 5
+    PERIODS_PER_DAY = 8  # 3-hourly
+    RESOLUTIONS = ('3h', 'daily')
+
+    @conditional_get(max_age=settings.WEATHER_FORECAST_CACHE_TIMEOUT)
     def get(self, request, city_name):
+        """5-day forecast from OpenWeatherMap.
+
+        ?variables= (comma-separated FIELDS), ?horizon= (days, up to 5) and
+        ?resolution=3h|daily pick what is formatted; the upstream forecast is
+        fetched once per grid cell whatever the selection.
+        """
+        try:
+            fields = self._select_fields(request.query_params.get('variables'))
+            horizon = select_steps(request.query_params.get('horizon'), self.MAX_HORIZON_DAYS)
+            resolution = request.query_params.get('resolution', '3h')
+            if resolution not in self.RESOLUTIONS:
+                raise ValueError(f"resolution must be one of: {', '.join(self.RESOLUTIONS)}")
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
         try:
             # First get current weather to establish location
             current_api = CurrentWeatherAPI()
             current_data = current_api._fetch_weather_data(city_name)
             location = current_api._get_or_create_location(city_name, current_data)
+            record_usage(request, location.id)
+            
+            # Fetch forecast from OpenWeatherMap (shared by every location in the grid cell)
+            cell_key, cell_lat, cell_lon = snap_to_grid(location.latitude, location.longitude)
+            forecast_data = get_or_compute(
+                make_key('owm_forecast', cell_key),
+                lambda: self._fetch_forecast_data(cell_lat, cell_lon),
+                settings.WEATHER_FORECAST_CACHE_TIMEOUT,
+                stale_timeout=settings.WEATHER_STALE_CACHE_TIMEOUT
+            )
             
-            if request.user.is_authenticated:
-                UserSearchHistory.objects.create(
-                    user=request.user,
-                    location=location,
-                    via_api=True
-                )
-            
-            # Fetch forecast from OpenWeatherMap
-            forecast_url = f"https://api.openweathermap.org/data/2.5/forecast?lat={location.latitude}&lon={location.longitude}&appid={settings.WEATHER_API_KEY}&units=metric"
-            forecast_response = requests.get(forecast_url)
-            forecast_data = forecast_response.json()
-            
-            # Process forecast data
-            forecasts = []
-            for period in forecast_data['list'][:40]:  # Get first 40 periods (5 days)
-                forecast_time = timezone.datetime.fromtimestamp(period['dt'])
-                forecasts.append({
-                    "datetime": forecast_time.strftime('%Y-%m-%d %H:%M:%S'),
-                    "temperature": period['main']['temp'],
-                    "feels_like": period['main']['feels_like'],
-                    "weather": {
-                        "main": period['weather'][0]['main'],
-                        "description": period['weather'][0]['description'],
-                        "icon": f"https://openweathermap.org/img/wn/{period['weather'][0]['icon']}@2x.png"
-                    },
-                    "humidity": period['main']['humidity'],
-                    "wind_speed": period['wind']['speed'],
-                    "precipitation": period.get('rain', {}).get('3h', 0)
-                })
+            # Process only the requested periods and fields
+            if resolution == 'daily':
+                forecasts = self._format_daily(forecast_data['list'], fields, horizon)
+            else:
+                periods = forecast_data['list'][:horizon * self.PERIODS_PER_DAY]
+                forecasts = [self._format_period(period, fields) for period in periods]
             
             return Response({
                 "location": location.name,
                 "country": location.country,
+                "resolution": resolution,
                 "forecasts": forecasts
             })
             
+        except QuotaExceeded as e:
+            return quota_exceeded_response(e)
+        except ReplayMiss as e:
+            return replay_miss_response(e)
         except Exception as e:
             return Response(
                 {"error": f"Could not fetch forecast: {str(e)}"},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+    def _select_fields(self, value):
+        if not value:
+            return self.FIELDS
+        fields = {name.strip() for name in value.split(',') if name.strip()}
+        unknown = fields - set(self.FIELDS)
+        if unknown or not fields:
+            raise ValueError(f"variables must be chosen from: {', '.join(self.FIELDS)}")
+        return [field for field in self.FIELDS if field in fields]
+
+    def _weather_icon(self, weather):
+        return {
+            "main": weather['main'],
+            "description": weather['description'],
+            "icon": f"https://openweathermap.org/img/wn/{weather['icon']}@2x.png"
+        }
+
+    def _format_period(self, period, fields):
+        """One 3-hour period with just the selected fields"""
+        forecast_time = timezone.datetime.fromtimestamp(period['dt'])
+        formatted = {"datetime": forecast_time.strftime('%Y-%m-%d %H:%M:%S')}
+        for field in fields:
+            if field == 'temperature':
+                formatted['temperature'] = period['main']['temp']
+            elif field == 'feels_like':
+                formatted['feels_like'] = period['main']['feels_like']
+            elif field == 'weather':
+                formatted['weather'] = self._weather_icon(period['weather'][0])
+            elif field == 'humidity':
+                formatted['humidity'] = period['main']['humidity']
+            elif field == 'wind_speed':
+                formatted['wind_speed'] = period['wind']['speed']
+            elif field == 'precipitation':
+                formatted['precipitation'] = period.get('rain', {}).get('3h', 0)
+        return formatted
+
+    def _format_daily(self, periods, fields, horizon):
+        """Aggregate 3-hour periods over the first `horizon` calendar days:
+        temperature min/max/average, mean feels-like and humidity, peak wind,
+        total precipitation and the most frequent weather"""
+        days = {}
+        for period in periods:
+            date = timezone.datetime.fromtimestamp(period['dt']).strftime('%Y-%m-%d')
+            if date not in days and len(days) == horizon:
+                break
+            days.setdefault(date, []).append(period)
+        
+        forecasts = []
+        for date, day_periods in days.items():
+            formatted = {"date": date, "periods": len(day_periods)}
+            for field in fields:
+                if field == 'temperature':
+                    temps = [period['main']['temp'] for period in day_periods]
+                    formatted['temperature'] = {
+                        "min": min(temps),
+                        "max": max(temps),
+                        "average": round(sum(temps) / len(temps), 1)
+                    }
+                elif field == 'feels_like':
+                    feels = [period['main']['feels_like'] for period in day_periods]
+                    formatted['feels_like'] = round(sum(feels) / len(feels), 1)
+                elif field == 'weather':
+                    mains = [period['weather'][0]['main'] for period in day_periods]
+                    dominant = max(mains, key=mains.count)
+                    weather = next(period['weather'][0] for period in day_periods if period['weather'][0]['main'] == dominant)
+                    formatted['weather'] = self._weather_icon(weather)
+                elif field == 'humidity':
+                    humidity = [period['main']['humidity'] for period in day_periods]
+                    formatted['humidity'] = round(sum(humidity) / len(humidity), 1)
+                elif field == 'wind_speed':
+                    formatted['wind_speed'] = max(period['wind']['speed'] for period in day_periods)
+                elif field == 'precipitation':
+                    formatted['precipitation'] = round(sum(period.get('rain', {}).get('3h', 0) for period in day_periods), 2)
+            forecasts.append(formatted)
+        return forecasts
+
+    def _fetch_forecast_data(self, lat, lon, priority=quota.INTERACTIVE):
+        """Fetch the raw 5-day / 3-hour forecast from OpenWeatherMap"""
+        forecast_url = f"https://api.openweathermap.org/data/2.5/forecast?lat={lat}&lon={lon}&appid={settings.WEATHER_API_KEY}&units=metric"
+        forecast_response = upstream.fetch(forecast_url, priority=priority)
+        forecast_data = forecast_response.json()
+        if 'list' not in forecast_data:
+            raise ValueError(f"Forecast API error: {forecast_response.status_code}")
+        return forecast_data
+
+def seconds_until_midnight():
+    """ARIMA forecasts are refitted daily, so they stay fresh until the date changes"""
+    now = timezone.now()
+    tomorrow = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return int((tomorrow - now).total_seconds())
+
 class ARIMAForecastAPI(APIView):
     permission_classes = [AllowAny]
 
+    insufficient_history_error = {
+        "error": "Could not fetch sufficient historical data for ARIMA training",
+        "fallback": "using_default"
+    }
+
+    @conditional_get(max_age=seconds_until_midnight)
     def get(self, request, city_name):
-        """Generate 7-day ARIMA forecast for a city"""
+        """Generate 7-day ARIMA forecast for a city.
+
+        ?engine= picks another forecasting engine. ?variables= (comma-separated,
+        "temperature" for max and min) and ?horizon= (days, up to 7) limit which
+        models are fitted and how far ahead. ?mode=queue runs the fit on the
+        dedicated forecasting Celery queue and answers 202 with a poll URL, after
+        waiting up to ?wait= seconds for the result.
+        """
+        try:
+            engine = get_engine(request.query_params.get('engine'))
+            variables = select_variables(request.query_params.get('variables'))
+            steps = select_steps(request.query_params.get('horizon'))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        mode = request.query_params.get('mode', settings.ARIMA_FORECAST_MODE)
+        if mode not in ('inline', 'queue'):
+            return Response({"error": "mode must be 'inline' or 'queue'"}, status=status.HTTP_400_BAD_REQUEST)
+        
         try:
             # Get location coordinates
             current_api = CurrentWeatherAPI()
             current_data = current_api._fetch_weather_data(city_name)
             location = current_api._get_or_create_location(city_name, current_data)
+            record_usage(request, location.id, search=False)
             
-            # Get historical data from Open-Meteo for ARIMA training
-            historical_data = self._get_historical_weather_data(
-                location.latitude, 
-                location.longitude
-            )
-            
-            if historical_data is None or historical_data.empty:
-                return Response(
-                    {"error": "Could not fetch sufficient historical data for ARIMA training", "fallback": "using_default"},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-            
-            # Generate ARIMA forecast
-            arima_forecast, model_status = self._generate_arima_forecast(historical_data)
+            # Already fitted forecasts are cheap, so only queue real work
+            if mode == 'queue' and not self._is_forecast_cached(location, engine, variables, steps):
+                return self._queue_forecast(request, location, engine, variables, steps)
             
-            # Prepare response
-            response_data = {
-                "location": location.name,
-                "country": location.country,
-                "coordinates": {
-                    "latitude": location.latitude,
-                    "longitude": location.longitude
-                },
-                "forecast_type": "ARIMA_7Day",
-                "historical_data_points": len(historical_data),
-                "model_status": model_status,
-                "forecast": arima_forecast,
-                "generated_at": timezone.now().strftime('%Y-%m-%d %H:%M:%S')
-            }
+            response_data = self._build_forecast(location, engine, variables, steps)
+            if response_data is None:
+                return Response(self.insufficient_history_error, status=status.HTTP_400_BAD_REQUEST)
             
             return Response(response_data)
             
+        except QuotaExceeded as e:
+            return quota_exceeded_response(e)
+        except ReplayMiss as e:
+            return replay_miss_response(e)
         except Exception as e:
             return Response(
                 {"error": f"Could not generate ARIMA forecast: {str(e)}"},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-    def _get_historical_weather_data(self, lat, lon, days=60):
+    def _forecast_cache_key(self, location, engine, variables=FORECAST_VARIABLES, steps=FORECAST_STEPS):
+        """Forecasts are shared by every location in the grid cell and refreshed daily;
+        each variable selection and horizon is cached on its own"""
+        cell_key, cell_lat, cell_lon = snap_to_grid(location.latitude, location.longitude)
+        return make_key(
+            'arima', engine.name, cell_key, timezone.now().strftime('%Y-%m-%d'), '+'.join(variables), steps
+        )
+
+    def _is_forecast_cached(self, location, engine, variables=FORECAST_VARIABLES, steps=FORECAST_STEPS):
+        return self._cached_forecast(location, engine, variables, steps) is not None
+
+    def _cached_forecast(self, location, engine, variables=FORECAST_VARIABLES, steps=FORECAST_STEPS):
+        """The cached forecast for a selection or None. Warm-up and the refit task
+        only cache the full selection, so other selections are cut from that."""
+        cell_forecast = cache.get(self._forecast_cache_key(location, engine, variables, steps))
+        if cell_forecast is None and (list(variables), steps) != (FORECAST_VARIABLES, FORECAST_STEPS):
+            full_forecast = cache.get(self._forecast_cache_key(location, engine))
+            if full_forecast is not None:
+                cell_forecast = self._select_forecast(full_forecast, engine, variables, steps)
+        return cell_forecast
+
+    def _select_forecast(self, cell_forecast, engine, variables, steps):
+        """Cut the requested variables and days out of a full cell forecast"""
+        formatted_forecast, model_status, data_points = cell_forecast
+        model_status = {column: model_status[column] for column in variables}
+        confidence = "low" if "failed" in model_status.values() else "high"
+        
+        temperature_names = [name for name in ('max', 'min') if f"temperature_{name}" in variables]
+        if len(temperature_names) == 2:
+            temperature_names.append("average")
+
+        selected_forecast = []
+        for day in formatted_forecast[:steps]:
+            selected = {"date": day["date"], "day": day["day"]}
+            if temperature_names:
+                selected["temperature"] = {name: day["temperature"][name] for name in temperature_names}
+            for column in ('precipitation', 'wind_speed', 'humidity'):
+                if column in variables:
+                    selected[column] = day[column]
+            selected["confidence"] = confidence
+            selected["model_notes"] = self._model_notes(engine, confidence)
+            selected_forecast.append(selected)
+        return selected_forecast, model_status, data_points
+
+    def _build_forecast(self, location, engine, variables=FORECAST_VARIABLES, steps=FORECAST_STEPS):
+        """Return the forecast payload for a location, or None without enough history"""
+        cell_key, cell_lat, cell_lon = snap_to_grid(location.latitude, location.longitude)
+        cache_key = self._forecast_cache_key(location, engine, variables, steps)
+        if collecting_fits():
+            # A profiled request refits so its fit statistics are captured
+            cell_forecast = self._forecast_cell(cell_key, cell_lat, cell_lon, engine, variables, steps)
+            if cell_forecast is not None:
+                store(cache_key, cell_forecast, settings.WEATHER_HISTORY_CACHE_TIMEOUT)
+        else:
+            cell_forecast = self._cached_forecast(location, engine, variables, steps) or get_or_compute(
+                cache_key,
+                lambda: self._forecast_cell(cell_key, cell_lat, cell_lon, engine, variables, steps),
+                settings.WEATHER_HISTORY_CACHE_TIMEOUT
+            )
+        if cell_forecast is None:
+            return None
+        
+        arima_forecast, model_status, data_points = cell_forecast
+        return {
+            "location": location.name,
+            "country": location.country,
+            "coordinates": {
+                "latitude": location.latitude,
+                "longitude": location.longitude
+            },
+            "forecast_type": f"{engine.label}_{steps}Day",
+            "engine": engine.name,
+            "variables": variables,
+            "horizon_days": steps,
+            "historical_data_points": data_points,
+            "model_status": model_status,
+            "forecast": arima_forecast,
+            "generated_at": timezone.now().strftime('%Y-%m-%d %H:%M:%S')
+        }
+
+    def _forecast_cell(self, cell_key, lat, lon, engine, variables=FORECAST_VARIABLES, steps=FORECAST_STEPS):
+        """Fit the models for one grid cell -> (forecast, model_status, data_points)"""
+        historical_data = self._cell_history(cell_key, lat, lon)
+        if historical_data is None or historical_data.empty:
+            return None
+        
+        # Generate ARIMA forecast
+        arima_forecast, model_status = self._generate_arima_forecast(historical_data, engine, variables, steps)
+        return arima_forecast, model_status, len(historical_data)
+
+    def _cell_history(self, cell_key, lat, lon, priority=quota.INTERACTIVE):
+        """Historical data from Open-Meteo for ARIMA training, fetched once per cell and day"""
+        return get_or_compute(
+            make_key('history', cell_key, timezone.now().strftime('%Y-%m-%d')),
+            lambda: self._get_historical_weather_data(lat, lon, priority=priority),
+            settings.WEATHER_HISTORY_CACHE_TIMEOUT
+        )
+
+    def _forecast_cells(self, locations, engine, variables=FORECAST_VARIABLES, steps=FORECAST_STEPS, priority=quota.BACKGROUND):
+        """Fit the forecasts of many locations with one engine.forecast_many call
+        (a single batched solve for the vectorized engine) and cache them per
+        cell. Cells already cached or without history are skipped; returns the
+        number of cells fitted."""
+        cells = {}
+        for location in locations:
+            cache_key = self._forecast_cache_key(location, engine, variables, steps)
+            if cache_key in cells or cache.get(cache_key) is not None:
+                continue
+            cell_key, cell_lat, cell_lon = snap_to_grid(location.latitude, location.longitude)
+            historical_data = self._cell_history(cell_key, cell_lat, cell_lon, priority)
+            if historical_data is not None and not historical_data.empty:
+                cells[cache_key] = historical_data
+        
+        histories = list(cells.values())
+        for cache_key, historical_data, (forecast_results, model_errors, model_status) in zip(
+            cells, histories, engine.forecast_many(histories, steps, variables)
+        ):
+            formatted_forecast = self._format_forecast_response(forecast_results, model_errors, engine, steps)
+            store(cache_key, (formatted_forecast, model_status, len(historical_data)), settings.WEATHER_HISTORY_CACHE_TIMEOUT)
+        return len(cells)
+
+    def _queue_forecast(self, request, location, engine, variables=FORECAST_VARIABLES, steps=FORECAST_STEPS):
+        """Submit (or join) the forecast job for a location and wait up to ?wait= seconds"""
+        from celery.exceptions import TimeoutError as CeleryTimeoutError
+        from config.celery import app as celery_app  # noqa: F401 (project app must be current)
+        from .tasks import submit_forecast_job
+        
+        try:
+            wait = float(request.query_params.get('wait', settings.ARIMA_FORECAST_WAIT))
+        except ValueError:
+            return Response({"error": "wait must be a number of seconds"}, status=status.HTTP_400_BAD_REQUEST)
+        wait = max(0, min(wait, settings.ARIMA_FORECAST_MAX_WAIT))
+        
+        job = submit_forecast_job(location.pk, engine.name, variables, steps)
+        if wait:
+            try:
+                job.get(timeout=wait, propagate=False)
+            except CeleryTimeoutError:
+                pass
+        return forecast_job_response(request, job.id)
+
+    def _get_historical_weather_data(self, lat, lon, days=60, priority=quota.INTERACTIVE):
         """Fetch historical weather data for ARIMA training - FIXED VERSION"""
         try:
             # Use the CORRECT historical API endpoint
@@ -280,14 +595,15 @@ class ARIMAForecastAPI(APIView):
                 "timezone": "auto"
             }
             
-            response = requests.get(url, params=params, timeout=15)
+            response = upstream.fetch(url, params=params, bucket=upstream.OPEN_METEO, priority=priority, timeout=15)
             data = response.json()
             
             if 'daily' not in data:
                 print(f"No historical data found for {lat},{lon}")
                 return None
             
-            # Convert to DataFrame
+            # Convert to DataFrame (pandas is only loaded by the forecasting endpoints)
+            import pandas as pd
             daily_data = data['daily']
             df = pd.DataFrame({
                 'date': pd.to_datetime(daily_data['time']),
@@ -301,95 +617,114 @@ class ARIMAForecastAPI(APIView):
             print(f"Successfully fetched {len(df)} days of historical data")
             return df
             
+        except (QuotaExceeded, ReplayMiss):
+            raise
         except Exception as e:
             print(f"Error fetching historical data: {e}")
             return None
 
-    def _generate_arima_forecast(self, historical_data):
-        """Generate 7-day forecast using ARIMA models - IMPROVED VERSION"""
-        forecast_results = {}
-        model_errors = {}
-        model_status = {}
-        
-        # Define ARIMA parameters for different weather variables
-        arima_config = {
-            'temperature_max': {'order': (3, 1, 2), 'steps': 7},
-            'temperature_min': {'order': (3, 1, 2), 'steps': 7},
-            'precipitation': {'order': (1, 1, 1), 'steps': 7},
-            'wind_speed': {'order': (2, 1, 1), 'steps': 7},
-            'humidity': {'order': (2, 1, 1), 'steps': 7}
-        }
-        
-        for column, config in arima_config.items():
-            try:
-                # Handle missing values better
-                series = historical_data[column].fillna(method='ffill').fillna(method='bfill')
-                
-                if len(series) < 30:
-                    raise ValueError(f"Not enough data points: {len(series)}")
-                
-                # Train ARIMA model
-                model = ARIMA(series, order=config['order'])
-                model_fit = model.fit()
-                
-                # Generate forecast
-                forecast = model_fit.forecast(steps=config['steps'])
-                forecast_results[column] = forecast.tolist()
-                model_errors[column] = "success"
-                model_status[column] = "trained"
-                
-            except Exception as e:
-                error_msg = f"ARIMA failed for {column}: {str(e)}"
-                print(error_msg)
-                model_errors[column] = error_msg
-                model_status[column] = "failed"
-                # Use simple average as fallback
-                avg_value = series.mean() if len(series) > 0 else 0
-                forecast_results[column] = [avg_value] * config['steps']
+    def _generate_arima_forecast(self, historical_data, engine=None, variables=FORECAST_VARIABLES, steps=FORECAST_STEPS):
+        """Generate a forecast with the selected forecasting engine (ARIMA by default),
+        fitting only the requested variables"""
+        engine = engine or get_engine()
+        forecast_results, model_errors, model_status = engine.forecast(historical_data, steps, variables)
         
         # Format response with error information
-        formatted_forecast = self._format_forecast_response(forecast_results, model_errors)
+        formatted_forecast = self._format_forecast_response(forecast_results, model_errors, engine, steps)
         return formatted_forecast, model_status
 
-    def _format_forecast_response(self, forecast_results, model_errors):
-        """Format the forecast response with confidence levels"""
+    def _format_forecast_response(self, forecast_results, model_errors, engine, steps=FORECAST_STEPS):
+        """Format the forecast response with confidence levels (only the variables
+        that were forecast appear in each day)"""
         today = timezone.now().date()
         formatted_forecast = []
         
-        for i in range(7):
+        # Determine confidence based on model errors
+        has_errors = any("failed" in error for error in model_errors.values())
+        confidence = "low" if has_errors else "high"
+        
+        for i in range(steps):
             forecast_date = today + timedelta(days=i+1)
-            
-            # Determine confidence based on model errors
-            has_errors = any("failed" in error for error in model_errors.values())
-            confidence = "low" if has_errors else "high"
-            
-            formatted_forecast.append({
+            day = {
                 "date": forecast_date.strftime('%Y-%m-%d'),
                 "day": forecast_date.strftime('%A'),
-                "temperature": {
-                    "max": round(forecast_results['temperature_max'][i], 1),
-                    "min": round(forecast_results['temperature_min'][i], 1),
-                    "average": round((forecast_results['temperature_max'][i] + 
-                                    forecast_results['temperature_min'][i]) / 2, 1)
-                },
-                "precipitation": round(max(0, forecast_results['precipitation'][i]), 2),
-                "wind_speed": round(max(0, forecast_results['wind_speed'][i]), 1),
-                "humidity": round(max(0, min(100, forecast_results['humidity'][i])), 1),
-                "confidence": confidence,
-                "model_notes": "ARIMA forecast based on 60 days of historical data" if confidence == "high" else "Partial ARIMA forecast with some fallback values"
-            })
+            }
+            
+            temperature = {}
+            if 'temperature_max' in forecast_results:
+                temperature["max"] = round(forecast_results['temperature_max'][i], 1)
+            if 'temperature_min' in forecast_results:
+                temperature["min"] = round(forecast_results['temperature_min'][i], 1)
+            if len(temperature) == 2:
+                temperature["average"] = round((forecast_results['temperature_max'][i] + 
+                                                forecast_results['temperature_min'][i]) / 2, 1)
+            if temperature:
+                day["temperature"] = temperature
+            if 'precipitation' in forecast_results:
+                day["precipitation"] = round(max(0, forecast_results['precipitation'][i]), 2)
+            if 'wind_speed' in forecast_results:
+                day["wind_speed"] = round(max(0, forecast_results['wind_speed'][i]), 1)
+            if 'humidity' in forecast_results:
+                day["humidity"] = round(max(0, min(100, forecast_results['humidity'][i])), 1)
+            
+            day["confidence"] = confidence
+            day["model_notes"] = self._model_notes(engine, confidence)
+            formatted_forecast.append(day)
         
         return formatted_forecast
 
+    def _model_notes(self, engine, confidence):
+        if confidence == "high":
+            return f"{engine.label} forecast based on 60 days of historical data"
+        return f"Partial {engine.label} forecast with some fallback values"
+
+def forecast_job_response(request, job_id):
+    """202 with a poll URL while a forecast job runs, its payload once it is done"""
+    # Imported here so web processes only load Celery once a job is queued
+    from config.celery import app as celery_app
+    job = celery_app.AsyncResult(job_id)
+    if not job.ready():
+        poll_url = request.build_absolute_uri(reverse('forecast-job', args=[job_id]))
+        return Response(
+            {"job_id": job_id, "status": job.status.lower(), "poll_url": poll_url},
+            status=status.HTTP_202_ACCEPTED,
+            headers={"Location": poll_url, "Retry-After": "2"}
+        )
+    
+    result = job.result if job.successful() else {"error": f"Forecast job failed: {job.result}"}
+    if "error" in result:
+        return Response(result, status=status.HTTP_400_BAD_REQUEST)
+    return Response(result)
+
+class ForecastJobAPI(APIView):
+    permission_classes = [AllowAny]
+
+    def get(self, request, job_id):
+        """Poll a queued ARIMA forecast job"""
+        return forecast_job_response(request, job_id)
+
 class CombinedForecastAPI(APIView):
     permission_classes = [AllowAny]
 
+    # ?variables= both forecasts understand (OWM field names, ARIMA variables/groups)
+    VARIABLES = ['temperature', 'precipitation', 'wind_speed', 'humidity']
+
+    @conditional_get(max_age=settings.WEATHER_FORECAST_CACHE_TIMEOUT)
     def get(self, request, city_name):
-        """Combine OpenWeatherMap forecast with ARIMA predictions"""
+        """Combine OpenWeatherMap forecast with ARIMA predictions.
+
+        ?variables= takes the VARIABLES both sides share. ?horizon= goes up to the
+        ARIMA's 7 days, with the OpenWeatherMap part capped at its 5.
+        """
+        try:
+            owm_params, arima_params = self._split_selection(request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
         try:
             # Get OpenWeatherMap forecast
             forecast_api = WeatherForecastAPI()
-            owm_forecast_response = forecast_api.get(request, city_name)
+            owm_forecast_response = forecast_api.get(self._with_params(request, owm_params), city_name)
             
             # Check if the response is an error
             if owm_forecast_response.status_code != status.HTTP_200_OK:
@@ -399,10 +734,10 @@ class CombinedForecastAPI(APIView):
             
             # Get ARIMA forecast
             arima_api = ARIMAForecastAPI()
-            arima_forecast_response = arima_api.get(request, city_name)
+            arima_forecast_response = arima_api.get(self._with_params(request, arima_params), city_name)
             
-            # Check if the response is an error
-            if arima_forecast_response.status_code != status.HTTP_400_BAD_REQUEST:
+            # Check if the response is an error (or a queued job that isn't finished)
+            if arima_forecast_response.status_code == status.HTTP_200_OK:
                 arima_data = arima_forecast_response.data
                 arima_available = True
             else:
@@ -430,6 +765,123 @@ class CombinedForecastAPI(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+    def _split_selection(self, params):
+        """Translate the combined ?variables= / ?horizon= into each inner view's terms"""
+        owm_params, arima_params = params.copy(), params.copy()
+        for inner in (owm_params, arima_params):
+            inner.pop('variables', None)
+            inner.pop('horizon', None)
+        
+        if params.get('variables'):
+            names = [name.strip() for name in params['variables'].split(',') if name.strip()]
+            if not names or set(names) - set(self.VARIABLES):
+                raise ValueError(f"variables must be chosen from: {', '.join(self.VARIABLES)}")
+            owm_params['variables'] = arima_params['variables'] = ','.join(names)
+        
+        if params.get('horizon'):
+            horizon = select_steps(params['horizon'])
+            arima_params['horizon'] = str(horizon)
+            owm_params['horizon'] = str(min(horizon, WeatherForecastAPI.MAX_HORIZON_DAYS))
+        return owm_params, arima_params
+
+    def _with_params(self, request, params):
+        """The same request with other query parameters, for an inner view"""
+        inner = copy.copy(request)
+        inner._request = copy.copy(request._request)
+        inner._request.GET = params
+        # Usage the inner views record belongs to this request (see conditional_get)
+        if getattr(request, 'weather_usage', None) is None:
+            request.weather_usage = {}
+        inner.weather_usage = request.weather_usage
+        return inner
+
+class PopularLocationsAPI(APIView):
+    permission_classes = [AllowAny]
+    
+    def get(self, request):
+        """Most searched locations in the last ?hours= hours (default 1), from the hourly counters"""
+        try:
+            hours = max(1, min(int(request.query_params.get('hours', 1)), 24 * 30))
+            limit = max(1, min(int(request.query_params.get('limit', 10)), 100))
+        except ValueError:
+            return Response({"error": "hours and limit must be numbers"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        data = get_or_compute(
+            make_key('popular', hours, limit),
+            lambda: [{
+                'location_id': row['location_id'],
+                'location': row['location__name'],
+                'country': row['location__country'],
+                'latitude': row['location__latitude'],
+                'longitude': row['location__longitude'],
+                'searches': row['searches']
+            } for row in popular_locations(hours, limit)],
+            settings.WEATHER_POPULAR_CACHE_TIMEOUT
+        )
+        response = Response(data)
+        patch_cache_control(response, public=True, max_age=settings.WEATHER_POPULAR_CACHE_TIMEOUT)
+        return response
+
+class ReadinessAPI(APIView):
+    permission_classes = [AllowAny]
+    
+    def get(self, request):
+        """Load balancer readiness probe: 503 until the caches have been warmed"""
+        ready = is_ready()
+        response = Response(
+            {"ready": ready, "warmup": warmup_status()},
+            status=status.HTTP_200_OK if ready else status.HTTP_503_SERVICE_UNAVAILABLE
+        )
+        patch_cache_control(response, no_store=True)
+        return response
+
+class ProfileReportListAPI(APIView):
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request):
+        """Recent profiles (?kind=request|task, ?limit=), without their cProfile text"""
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', 50)), 500))
+        except ValueError:
+            return Response({"error": "limit must be a number"}, status=status.HTTP_400_BAD_REQUEST)
+        
+        reports = ProfileReport.objects.defer('stats')
+        if request.query_params.get('kind'):
+            reports = reports.filter(kind=request.query_params['kind'])
+        
+        data = [{
+            'id': report.id,
+            'kind': report.kind,
+            'name': report.name,
+            'created_at': report.created_at,
+            'seconds': report.seconds,
+            'status_code': report.status_code,
+            'fits': report.fits,
+            'url': reverse('profile-report', args=[report.id])
+        } for report in reports[:limit]]
+        return Response(data)
+
+class ProfileReportAPI(APIView):
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request, report_id):
+        """One profile with its fit statistics and cProfile output"""
+        try:
+            report = ProfileReport.objects.get(pk=report_id)
+        except ProfileReport.DoesNotExist:
+            return Response({"error": "Profile not found"}, status=status.HTTP_404_NOT_FOUND)
+        
+        return Response({
+            'id': report.id,
+            'kind': report.kind,
+            'name': report.name,
+            'created_at': report.created_at,
+            'seconds': report.seconds,
+            'status_code': report.status_code,
+            'fits': report.fits,
+            'stats': report.stats
+        })
+
 class UserSearchHistoryAPI(APIView):
     permission_classes = [IsAuthenticated]
     
@@ -447,3 +899,71 @@ class UserSearchHistoryAPI(APIView):
         } for search in searches]
         
         return Response(data)
+
+class WeatherDataExportAPI(APIView):
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request, export_format):
+        """Stream WeatherData history as CSV or NDJSON.
+        
+        Filters: ?location=<id>,<id> and/or ?city=<name>, ?start= / ?end= (ISO
+        date or datetime, end exclusive), ?kind=observed|forecast|all.
+        Rows are read in keyset-ordered chunks, so memory stays flat however
+        large the range is.
+        """
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {"error": f"Format must be one of: {', '.join(EXPORT_FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            locations = self._get_locations(request)
+            start = self._parse_time(request.query_params.get('start'))
+            end = self._parse_time(request.query_params.get('end'))
+            kind = request.query_params.get('kind', 'all')
+            is_forecast = {'all': None, 'observed': False, 'forecast': True}[kind]
+        except KeyError:
+            return Response({"error": "kind must be observed, forecast or all"}, status=status.HTTP_400_BAD_REQUEST)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        stream, content_type = EXPORT_FORMATS[export_format]
+        rows = iter_weather_rows(
+            locations, start=start, end=end, is_forecast=is_forecast,
+            chunk_size=settings.WEATHER_EXPORT_CHUNK_SIZE
+        )
+        response = StreamingHttpResponse(stream(rows), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="weather-data.{export_format}"'
+        return response
+
+    def _get_locations(self, request):
+        """Locations selected by ?location= ids and/or ?city= names (all if neither)"""
+        locations = Location.objects.order_by('id')
+        ids = request.query_params.get('location')
+        cities = request.query_params.get('city')
+        if ids:
+            try:
+                locations = locations.filter(id__in=[int(value) for value in ids.split(',')])
+            except ValueError:
+                raise ValueError("location must be a comma-separated list of ids")
+        if cities:
+            query = Q()
+            for name in cities.split(','):
+                if name.strip():
+                    query |= Q(name__iexact=name.strip())
+            locations = locations.filter(query)
+        return locations.only('id', 'name')
+
+    def _parse_time(self, value):
+        if not value:
+            return None
+        parsed = parse_datetime(value)
+        if parsed is None:
+            day = parse_date(value)
+            if day is None:
+                raise ValueError(f"Invalid date or datetime: {value}")
+            parsed = datetime.combine(day, time.min)
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
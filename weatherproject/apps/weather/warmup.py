@@ -0,0 +1,170 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import timedelta
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.utils import timezone
+from .analytics import search_counts
+from .caching import get_or_compute, make_key
+from .exceptions import QuotaExceeded
+from .grid import snap_to_grid
+from .models import Location
+from . import quota
+
+logger = logging.getLogger(__name__)
+
+READY_KEY = make_key('warmup', 'ready')
+
+ARIMA_INLINE = 'inline'
+ARIMA_QUEUE = 'queue'
+ARIMA_SKIP = 'skip'
+ARIMA_MODES = (ARIMA_INLINE, ARIMA_QUEUE, ARIMA_SKIP)
+
+# Set once this process has seen a warm cache, so a later cache flush doesn't pull
+# running instances out of the load balancer (the scheduled warm-up refills it)
+_ready = False
+
+
+def top_locations(limit, days=None):
+    """The `limit` most searched locations over the last `days` days"""
+    days = settings.WEATHER_WARMUP_WINDOW_DAYS if days is None else days
+    counts = search_counts(timezone.now() - timedelta(days=days))
+    ids = sorted(counts, key=counts.get, reverse=True)[:limit]
+    locations = Location.objects.in_bulk(ids)
+    return [locations[location_id] for location_id in ids if location_id in locations]
+
+
+def warm_location(location, forecast=True, history=True):
+    """Fill the geocode and current-weather caches for a location and, when asked,
+    the OWM forecast and ARIMA training history of its grid cell (the models are
+    fitted afterwards in one batch). Upstream calls use background quota, so a
+    warm-up never starves user requests."""
+    from .views import ARIMAForecastAPI, CurrentWeatherAPI, WeatherForecastAPI
+
+    close_old_connections()
+    try:
+        CurrentWeatherAPI()._fetch_weather_data(location.name.lower(), quota.BACKGROUND)
+
+        if forecast:
+            cell_key, cell_lat, cell_lon = snap_to_grid(location.latitude, location.longitude)
+            get_or_compute(
+                make_key('owm_forecast', cell_key),
+                lambda: WeatherForecastAPI()._fetch_forecast_data(cell_lat, cell_lon, quota.BACKGROUND),
+                settings.WEATHER_FORECAST_CACHE_TIMEOUT,
+                stale_timeout=settings.WEATHER_STALE_CACHE_TIMEOUT
+            )
+
+        if history:
+            cell_key, cell_lat, cell_lon = snap_to_grid(location.latitude, location.longitude)
+            ARIMAForecastAPI()._cell_history(cell_key, cell_lat, cell_lon, quota.BACKGROUND)
+    finally:
+        close_old_connections()
+
+
+def warm_caches(limit=None, concurrency=None, arima=ARIMA_INLINE, engine_name=None):
+    """Warm the caches for the top locations with at most `concurrency` requests
+    in flight, then mark the cache ready. Returns a summary dict."""
+    from .forecasting import get_engine
+
+    limit = settings.WEATHER_WARMUP_LOCATIONS if limit is None else limit
+    concurrency = settings.WEATHER_WARMUP_CONCURRENCY if concurrency is None else concurrency
+    engine = get_engine(engine_name)
+    started = time.monotonic()
+
+    # OWM and ARIMA forecasts are per grid cell: fetch them once per cell
+    jobs = []
+    cells = set()
+    for location in top_locations(limit):
+        cell_key = snap_to_grid(location.latitude, location.longitude)[0]
+        jobs.append((location, cell_key not in cells))
+        cells.add(cell_key)
+
+    warmed, failed, skipped, stopped = [], [], [], None
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+        futures = {
+            executor.submit(
+                warm_location, location, first_in_cell, first_in_cell and arima == ARIMA_INLINE
+            ): location
+            for location, first_in_cell in jobs
+        }
+        for future in as_completed(futures):
+            location = futures[future]
+            if future.cancelled():
+                skipped.append(location.name)
+                continue
+            try:
+                future.result()
+                warmed.append(location.name)
+            except QuotaExceeded as e:
+                stopped = e
+                failed.append(location.name)
+            except Exception as e:
+                logger.error(f"Cache warm-up failed for {location.name}: {str(e)}")
+                failed.append(location.name)
+            if stopped:
+                # Out of background budget: the rest would fail the same way
+                for pending in futures:
+                    pending.cancel()
+
+    # One batched fit for every cell instead of a model per location
+    cell_locations = [location for location, first_in_cell in jobs if first_in_cell]
+    fitted = 0
+    if arima == ARIMA_INLINE and stopped is None:
+        from .views import ARIMAForecastAPI
+        try:
+            fitted = ARIMAForecastAPI()._forecast_cells(cell_locations, engine)
+        except QuotaExceeded as e:
+            stopped = e
+    elif arima == ARIMA_QUEUE and cell_locations:
+        from .tasks import refit_forecasts
+        refit_forecasts.delay([location.pk for location in cell_locations], engine.name)
+
+    summary = {
+        'locations': len(jobs),
+        'forecasts_fitted': fitted,
+        'warmed': len(warmed),
+        'failed': failed,
+        'skipped': skipped,
+        'quota_exhausted': stopped is not None,
+        'seconds': round(time.monotonic() - started, 2),
+        'warmed_at': timezone.now().isoformat(),
+    }
+    if stopped is not None:
+        logger.warning(f"Cache warm-up stopped early: {str(stopped)}")
+    mark_ready(summary)
+    return summary
+
+
+def mark_ready(summary):
+    """Publish the readiness signal (it lives in the cache, so a flush clears it)"""
+    cache.set(READY_KEY, summary, None)
+
+
+def warmup_status():
+    return cache.get(READY_KEY)
+
+
+@checks.register(checks.Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """A warm-up run by manage.py or Celery can't mark a per-process cache ready,
+    so requiring one there would keep /api/health/ready/ at 503 forever"""
+    backend = settings.CACHES['default']['BACKEND']
+    if settings.WEATHER_WARMUP_REQUIRED and backend.endswith(('LocMemCache', 'DummyCache')):
+        return [checks.Error(
+            "WEATHER_WARMUP_REQUIRED needs a cache shared between processes",
+            hint="Set REDIS_CACHE_URL, or WEATHER_WARMUP_REQUIRED=False",
+            obj='settings.WEATHER_WARMUP_REQUIRED',
+            id='weather.E001',
+        )]
+    return []
+
+
+def is_ready():
+    """True once the shared cache has been warmed (or warm-up isn't required)"""
+    global _ready
+    if not _ready:
+        _ready = not settings.WEATHER_WARMUP_REQUIRED or warmup_status() is not None
+    return _ready
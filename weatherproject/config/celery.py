@@ -1,5 +1,7 @@
 import os
 from celery import Celery
+from celery.schedules import crontab
+from celery.signals import celeryd_init
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
@@ -9,12 +11,37 @@ app.autodiscover_tasks()
 
 # Scheduled tasks
 app.conf.beat_schedule = {
-    'fetch-current-weather': {
-        'task': 'apps.weather.tasks.fetch_current_weather',
-        'schedule': 1800.0,  # Every 30 minutes (OpenWeather free tier allows 60 calls/minute)
+    'refresh-popular-locations': {
+        'task': 'apps.weather.tasks.refresh_popular_locations',
+        'schedule': 900.0,  # Every 15 minutes; each location's own interval depends on its popularity
+    },
+    'warm-caches-after-flush': {
+        'task': 'apps.weather.tasks.warm_caches',
+        'schedule': 300.0,  # Every 5 minutes; a no-op unless the cache was flushed
+        'kwargs': {'only_if_cold': True},
+    },
+    'refit-forecasts': {
+        'task': 'apps.weather.tasks.refit_forecasts',
+        'schedule': crontab(hour=0, minute=5),  # Forecast cache keys are per day
+    },
+    'prune-search-counts': {
+        'task': 'apps.weather.tasks.prune_search_counts',
+        'schedule': 86400.0,  # Daily
     },
     'fetch-16-day-forecast': {
         'task': 'apps.weather.tasks.fetch_16_day_forecast',
         'schedule': 43200.0,  # Every 12 hours (less frequent due to larger data)
     },
-}
\ No newline at end of file
+}
+
+
+@celeryd_init.connect
+def preload_forecasting_stack(sender=None, conf=None, options=None, **kwargs):
+    """Workers consuming the forecasting queue load numpy/pandas/statsmodels once,
+    before forking, instead of on the first job in every child process"""
+    queues = (options or {}).get('queues') or []
+    if isinstance(queues, str):
+        queues = queues.split(',')
+    if 'forecasting' in queues:
+        from apps.weather.forecasting import preload
+        preload()
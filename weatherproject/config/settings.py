@@ -60,6 +60,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'apps.weather.profiling.ProfilingMiddleware',  # Inert unless WEATHER_PROFILING_ENABLED
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -111,3 +112,118 @@ REST_FRAMEWORK = {
 }
 
 WEATHER_API_KEY = "#############"
+
+# Cache (shared Redis cache when REDIS_CACHE_URL is set, per-process memory otherwise)
+if os.getenv("REDIS_CACHE_URL"):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv("REDIS_CACHE_URL"),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Regional sharing: locations are bucketed into square cells of this many degrees
+# and upstream data / fitted models are fetched once per cell (0 disables it)
+WEATHER_GRID_SIZE = float(os.getenv("WEATHER_GRID_SIZE", "0"))
+WEATHER_CURRENT_CACHE_TIMEOUT = 60 * 10  # OWM current conditions
+WEATHER_FORECAST_CACHE_TIMEOUT = 60 * 60  # OWM 3-hourly forecast
+WEATHER_HISTORY_CACHE_TIMEOUT = 60 * 60 * 24  # Open-Meteo archive and ARIMA fits change daily
+WEATHER_GEOCODE_CACHE_TIMEOUT = 60 * 60 * 24 * 30  # City coordinates
+WEATHER_STALE_CACHE_TIMEOUT = 60 * 60 * 24  # Last good copy, served when the upstream quota is spent
+
+# Default engine for ARIMAForecastAPI ('arima' or 'vectorized'); ?engine= overrides it per request
+WEATHER_FORECAST_ENGINE = os.getenv("WEATHER_FORECAST_ENGINE", "arima")
+
+# Celery
+CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0")
+CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", "redis://localhost:6379/0")
+CELERY_TASK_ROUTES = {
+    # Run with: celery -A config worker -Q forecasting
+    'apps.weather.tasks.generate_forecast': {'queue': 'forecasting'},
+    'apps.weather.tasks.refit_forecasts': {'queue': 'forecasting'},
+}
+
+# 'inline' fits forecasts in the request thread, 'queue' hands them to the forecasting
+# queue (?mode= overrides it). Queued requests wait ARIMA_FORECAST_WAIT seconds
+# (?wait=, capped at ARIMA_FORECAST_MAX_WAIT) before answering 202 with a poll URL.
+ARIMA_FORECAST_MODE = os.getenv("ARIMA_FORECAST_MODE", "inline")
+ARIMA_FORECAST_WAIT = 0
+ARIMA_FORECAST_MAX_WAIT = 25
+ARIMA_FORECAST_JOB_TIMEOUT = 5 * 60  # Coalescing window for jobs of one location
+
+# Rows per keyset query in the streaming WeatherData export
+WEATHER_EXPORT_CHUNK_SIZE = 2000
+
+# Upstream API budgets shared by all web and Celery processes (needs REDIS_CACHE_URL
+# to be shared across processes). WEATHER_API_KEY and OPENWEATHER_API_KEY draw on
+# the same OpenWeatherMap account, so they share one bucket.
+UPSTREAM_QUOTAS = {
+    'openweather': {'calls': int(os.getenv("OPENWEATHER_CALLS_PER_MINUTE", "60")), 'period': 60},
+    'open-meteo': {'calls': int(os.getenv("OPEN_METEO_CALLS_PER_MINUTE", "500")), 'period': 60},
+}
+# Share of each window a priority class may use; background work leaves the rest
+# for user-facing requests
+UPSTREAM_PRIORITY_SHARES = {
+    'interactive': 1.0,
+    'background': 0.6,
+}
+
+# Adaptive refresh (apps.weather.tasks.refresh_popular_locations). Popularity is
+# searches in the last 24 hours plus request hits in the last WEATHER_HIT_WINDOW_HOURS.
+WEATHER_REFRESH_TIERS = (
+    # (tier, minimum popularity, seconds between refreshes)
+    ('hot', 10, 30 * 60),
+    ('warm', 1, 3 * 60 * 60),
+    ('cold', 0, 24 * 60 * 60),
+)
+WEATHER_DORMANT_AFTER_DAYS = 7  # No searches or hits for this long: never refreshed
+WEATHER_HIT_WINDOW_HOURS = 3
+WEATHER_REFRESH_MAX_SECONDS = 10 * 60  # A run paces its calls for at most this long
+# Upstream calls per run: what the background share of the OpenWeatherMap quota allows in that time
+WEATHER_REFRESH_BUDGET = int(
+    UPSTREAM_QUOTAS['openweather']['calls'] * UPSTREAM_PRIORITY_SHARES['background']
+    * WEATHER_REFRESH_MAX_SECONDS / UPSTREAM_QUOTAS['openweather']['period']
+)
+
+# City autocomplete (in-memory prefix index per process)
+WEATHER_AUTOCOMPLETE_REBUILD_SECONDS = 60 * 60  # Full rebuild to refresh popularity ranking
+WEATHER_AUTOCOMPLETE_POPULARITY_DAYS = 30
+WEATHER_AUTOCOMPLETE_CACHE_TIMEOUT = 60
+
+# Search analytics (hourly LocationSearchCount rollups of UserSearchHistory)
+WEATHER_POPULAR_CACHE_TIMEOUT = 60
+WEATHER_SEARCH_COUNT_RETENTION_DAYS = 90
+
+# Cache warm-up (manage.py warm_caches / apps.weather.tasks.warm_caches) for the
+# most searched locations. With WEATHER_WARMUP_REQUIRED, /api/health/ready/ answers
+# 503 until a warm-up has run, so new instances join the load balancer warm. The
+# readiness flag must be visible to the web processes, so this needs the shared
+# Redis cache and is off by default without it.
+WEATHER_WARMUP_LOCATIONS = int(os.getenv("WEATHER_WARMUP_LOCATIONS", "50"))
+WEATHER_WARMUP_CONCURRENCY = 4
+WEATHER_WARMUP_WINDOW_DAYS = 7
+WEATHER_WARMUP_REQUIRED = os.getenv(
+    "WEATHER_WARMUP_REQUIRED", "True" if os.getenv("REDIS_CACHE_URL") else "False"
+).lower() == "true"
+
+# Opt-in profiling. With WEATHER_PROFILING_ENABLED, staff users can add
+# `X-Weather-Profile: 1` or `?profile=1` to a request to store its cProfile stats
+# and model fit statistics (read them at /api/admin/profiles/). WEATHER_PROFILE_FITS
+# also records the fits of every queued forecast job.
+WEATHER_PROFILING_ENABLED = os.getenv("WEATHER_PROFILING_ENABLED", "False").lower() == "true"
+WEATHER_PROFILE_FITS = os.getenv("WEATHER_PROFILE_FITS", "False").lower() == "true"
+WEATHER_PROFILE_TOP_FUNCTIONS = 40
+
+# Upstream record/replay (apps.weather.replay). "record" saves every successful
+# OWM and Open-Meteo response, "replay" serves only recordings (CI, benchmarks),
+# "fallback" calls upstream but answers from the recording when it fails.
+WEATHER_UPSTREAM_MODE = os.getenv("WEATHER_UPSTREAM_MODE", "live")
+WEATHER_REPLAY_STORE = os.getenv("WEATHER_REPLAY_STORE", os.path.join(BASE_DIR, 'recordings', 'upstream.sqlite3'))
+# Left out of recording keys: credentials, and Open-Meteo's rolling date window
+WEATHER_REPLAY_IGNORED_PARAMS = ['appid', 'apikey', 'start_date', 'end_date']
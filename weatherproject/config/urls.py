@@ -6,11 +6,18 @@ from django.views.generic import TemplateView
 from rest_framework.authtoken import views as authtoken_views
 from apps.weather.views import (
     LocationListAPI, 
+    LocationAutocompleteAPI,
+    PopularLocationsAPI,
     WeatherForecastAPI, 
     CurrentWeatherAPI,
     UserSearchHistoryAPI,
     ARIMAForecastAPI,
-    CombinedForecastAPI
+    ForecastJobAPI,
+    CombinedForecastAPI,
+    WeatherDataExportAPI,
+    ReadinessAPI,
+    ProfileReportListAPI,
+    ProfileReportAPI
 )
 
 urlpatterns = [
@@ -18,10 +25,17 @@ urlpatterns = [
     
     # ONLY the API endpoints you need
     path('api/locations/', LocationListAPI.as_view(), name='location-list'),
+    path('api/locations/autocomplete/', LocationAutocompleteAPI.as_view(), name='location-autocomplete'),
+    path('api/locations/popular/', PopularLocationsAPI.as_view(), name='popular-locations'),
     path('api/weather/<str:city_name>/', CurrentWeatherAPI.as_view(), name='current-weather'),
     path('api/forecast/<str:city_name>/', WeatherForecastAPI.as_view(), name='weather-forecast'),
     path('api/arima-forecast/<str:city_name>/', ARIMAForecastAPI.as_view(), name='arima-forecast'),
+    path('api/forecast-jobs/<str:job_id>/', ForecastJobAPI.as_view(), name='forecast-job'),
     path('api/combined-forecast/<str:city_name>/', CombinedForecastAPI.as_view(), name='combined-forecast'),
+    path('api/export/weather-data/<str:export_format>/', WeatherDataExportAPI.as_view(), name='weather-data-export'),
+    path('api/health/ready/', ReadinessAPI.as_view(), name='readiness'),
+    path('api/admin/profiles/', ProfileReportListAPI.as_view(), name='profile-report-list'),
+    path('api/admin/profiles/<int:report_id>/', ProfileReportAPI.as_view(), name='profile-report'),
     path('api/search-history/', UserSearchHistoryAPI.as_view(), name='search-history'),
     path('api-token-auth/', authtoken_views.obtain_auth_token, name='api-token-auth'),
 
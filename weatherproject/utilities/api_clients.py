@@ -1,18 +1,21 @@
-import requests
 from datetime import datetime, timedelta
 import os
 from django.conf import settings
+from apps.weather import quota, replay, upstream
 
 class OpenWeatherClient:
     BASE_URL = os.getenv('OPENWEATHER_BASE_URL', 'https://api.openweathermap.org/data/3.0/')
     
-    def __init__(self):
+    def __init__(self, priority=quota.INTERACTIVE):
+        # Quota priority of this client's calls (the scheduled tasks use BACKGROUND)
+        self.priority = priority
         self.api_key = os.getenv('OPENWEATHER_API_KEY')
-        if not self.api_key:
+        # Recordings are keyed without credentials, so replay works without one
+        if not self.api_key and replay.get_mode() != replay.REPLAY:
             raise ValueError("OPENWEATHER_API_KEY not set in environment variables")
 
     def get_current_weather(self, lat, lon):
-        response = requests.get(
+        response = upstream.fetch(
             f"{self.BASE_URL}onecall",
             params={
                 'lat': lat,
@@ -20,7 +23,8 @@ class OpenWeatherClient:
                 'exclude': 'minutely,hourly,daily,alerts',
                 'appid': self.api_key,
                 'units': 'metric'
-            }
+            },
+            priority=self.priority
         )
         data = response.json()
         return {
@@ -34,7 +38,7 @@ class OpenWeatherClient:
 
     def get_16_day_forecast(self, lat, lon):
         """OpenWeatherMap provides 16-day forecasts (including today)"""
-        response = requests.get(
+        response = upstream.fetch(
             f"{self.BASE_URL}forecast/daily",
             params={
                 'lat': lat,
@@ -42,7 +46,8 @@ class OpenWeatherClient:
                 'cnt': 16,  # 16 days (including today)
                 'appid': self.api_key,
                 'units': 'metric'
-            }
+            },
+            priority=self.priority
         )
         data = response.json()
         forecasts = []